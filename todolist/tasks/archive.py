@@ -0,0 +1,96 @@
+"""
+Archival of old completed subtrees into TaskArchive.
+
+Only whole trees move: a root task is archived with all its descendants once every one of them is
+complete and unchanged for the configured age, so nothing left in the Task table points at an archived
+row. Each batch runs in its own transaction; the command just goes on from the last root id it saw.
+"""
+
+from django.db import transaction
+from django.db.models import Q
+from .cache import bump_version
+from .counters import COMPLETE, rebuild_counters
+from .models import Task, TaskArchive
+from .tree import delete_subtrees, subtree
+from .usage import apply_usage, link_counts
+
+ARCHIVED_FIELDS = ['title', 'description', 'expiration_date', 'state', 'path', 'updated_at']
+
+
+def candidate_roots(cutoff):
+    """
+    Root tasks complete and untouched since `cutoff`. Their descendants are only checked once the subtrees
+    are loaded, with constant path prefixes, by `archive_batch`.
+    """
+    return Task.objects.filter(parent_task=None, state=COMPLETE, updated_at__lt=cutoff)
+
+
+def archive_batch(cutoff, after_id=0, batch_size=500):
+    """
+    Look at up to `batch_size` candidate roots after `after_id` and archive the trees that are complete and
+    untouched throughout, together with their tag links, in one transaction. Returns the last root id looked
+    at (None when there are no more) and the number of archived trees and tasks.
+    """
+    with transaction.atomic():
+        roots = candidate_roots(cutoff).filter(id__gt=after_id).order_by('id')
+        root_ids = list(roots.values_list('id', flat=True)[:batch_size])
+        if not root_ids:
+            return None, 0, 0
+        # Locked before the whole trees are checked, so they cannot change until they are moved.
+        tasks = list(Task.objects.filter(subtree([Task(id=root_id) for root_id in root_ids])).select_for_update())
+        trees = {}
+        for task in tasks:
+            trees.setdefault(int(task.path.split('/')[0]) if task.path else task.id, []).append(task)
+        archived = [
+            task
+            for root_id, tree in trees.items()
+            if all(task.state == COMPLETE and task.updated_at < cutoff for task in tree)
+            for task in tree
+        ]
+        archived_ids = [task.id for task in archived]
+        TaskArchive.objects.bulk_create([
+            TaskArchive(
+                id=task.id, user_id=task.user_id, parent_task=task.parent_task_id,
+                **{ name: getattr(task, name) for name in ARCHIVED_FIELDS }
+            )
+            for task in archived
+        ])
+        ArchiveTag = TaskArchive.tags.through
+        ArchiveTag.objects.bulk_create([
+            ArchiveTag(taskarchive_id=task_id, tag_id=tag_id)
+            for task_id, tag_id in Task.tags.through.objects.filter(task_id__in=archived_ids).values_list(
+                'task_id', 'tag_id'
+            )
+        ])
+        archived_roots = [task.id for task in archived if task.parent_task_id is None]
+        delete_subtrees(Task.objects.filter(id__in=archived_roots))
+    return root_ids[-1], len(archived_roots), len(archived)
+
+
+def restore_tree(root):
+    """Move the archived tree of `root` (an archived root task) back into the Task table and return the root."""
+    with transaction.atomic():
+        rows = list(
+            TaskArchive.objects.filter(Q(pk=root.pk) | Q(path__startswith=f'{root.pk}/')).select_for_update()
+        )
+        ids = [row.id for row in rows]
+        Task.objects.bulk_create([
+            Task(
+                id=row.id, user_id=row.user_id, parent_task_id=row.parent_task,
+                **{ name: getattr(row, name) for name in ARCHIVED_FIELDS if name != 'updated_at' }
+            )
+            for row in sorted(rows, key=lambda row: len(row.path))
+        ])
+        TaskTag = Task.tags.through
+        TaskTag.objects.bulk_create([
+            TaskTag(task_id=task_id, tag_id=tag_id)
+            for task_id, tag_id in TaskArchive.tags.through.objects.filter(taskarchive_id__in=ids).values_list(
+                'taskarchive_id', 'tag_id'
+            )
+        ])
+        apply_usage(link_counts(TaskTag.objects.filter(task_id__in=ids)))
+        rebuild_counters(Task.objects.filter(id__in=ids))
+        TaskArchive.objects.filter(id__in=ids).delete()
+        # bulk_create() sends no model signals.
+        bump_version(root.user_id)
+    return Task.objects.get(pk=root.pk)
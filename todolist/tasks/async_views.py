@@ -0,0 +1,171 @@
+"""
+Async versions of the task list, detail and create endpoints for ASGI deployments.
+
+DRF views are synchronous, so these are plain async Django views that reach the database only through
+the async ORM. Their responses match TaskViewSet with page number pagination; the response cache and
+the ETags of the sync endpoints are not applied here, and reads always go to the primary database.
+"""
+
+from functools import wraps
+from io import BytesIO
+from math import ceil
+from django.http import HttpResponse
+from django.utils.translation import gettext_lazy as _
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from rest_framework.utils.mediatypes import media_type_matches, order_by_precedence
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from todolist.routers import apin_to_primary
+from .authentication import CachedJWTAuthentication
+from .bulk import aresolve_tags
+from .fastpath import TASK_VALUES, aserialize_task_rows
+from .filters import filter_tasks, task_ordering
+from .models import Task
+from .permissions import IsOwner
+from .renderers import MessagePackParser, ORJSONParser
+from .serializers import BulkTaskSerializer, parse_fieldset
+from .views import TaskPagination
+
+authentication = CachedJWTAuthentication()
+ownership = IsOwner()
+
+
+# The API renderers without the browsable API; request bodies are JSON or MessagePack documents.
+renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES if renderer.format != 'api']
+parsers = [ORJSONParser(), MessagePackParser()]
+
+
+def select_renderer(request):
+    """The first renderer matching the most specific media types of the Accept header, as DRF picks it."""
+    accept = [token.strip() for token in (request.headers.get('Accept') or '*/*').split(',')]
+    for media_types in order_by_precedence(accept):
+        for renderer in renderers:
+            if any(media_type_matches(renderer.media_type, media_type) for media_type in media_types):
+                return renderer
+    raise exceptions.NotAcceptable(available_renderers=renderers)
+
+
+def api_response(request, data, status=200, renderer=None):
+    # Same bytes as TaskViewSet responses with the same renderer.
+    renderer = renderer or select_renderer(request)
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
+
+
+def parse_body(request):
+    for parser in parsers:
+        if media_type_matches(parser.media_type, request.content_type):
+            return parser.parse(BytesIO(request.body), request.content_type)
+    raise exceptions.UnsupportedMediaType(request.content_type)
+
+
+def error_response(request, exc, methods):
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else { 'detail': exc.detail }
+    try:
+        renderer = select_renderer(request)
+    except exceptions.NotAcceptable:
+        renderer = renderers[0]
+    response = api_response(request, data, status=exc.status_code, renderer=renderer)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response.status_code = 401
+        response['WWW-Authenticate'] = authentication.authenticate_header(request)
+    elif isinstance(exc, exceptions.MethodNotAllowed):
+        response['Allow'] = ', '.join(methods)
+    return response
+
+
+def async_api_view(*methods):
+    """Authenticate with the async JWT lookup and turn DRF API exceptions into JSON error responses."""
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                user_auth = await authentication.aauthenticate(request)
+                if user_auth is None:
+                    raise exceptions.NotAuthenticated()
+                request.user, request.auth = user_auth
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return error_response(request, exc, methods)
+        return wrapper
+    return decorator
+
+
+def page_size(request):
+    try:
+        size = int(request.GET[TaskPagination.page_size_query_param])
+    except (KeyError, ValueError):
+        return TaskPagination.page_size
+    return min(size, TaskPagination.max_page_size) if size > 0 else TaskPagination.page_size
+
+
+async def paginate(request, rows):
+    """Slice `rows` like TaskPagination; returns the page and the count/next/previous envelope."""
+    size = page_size(request)
+    count = await rows.acount()
+    last = max(1, ceil(count / size))
+    number = request.GET.get('page', 1)
+    try:
+        number = last if number == 'last' else int(number)
+    except ValueError:
+        number = 0
+    if not 1 <= number <= last:
+        raise exceptions.NotFound(_('Invalid page.'))
+    page = [row async for row in rows[(number - 1) * size:number * size]]
+    url = request.build_absolute_uri()
+    if number == 1:
+        previous = None
+    elif number == 2:
+        previous = remove_query_param(url, 'page')
+    else:
+        previous = replace_query_param(url, 'page', number - 1)
+    return page, {
+        'count': count,
+        'next': replace_query_param(url, 'page', number + 1) if number < last else None,
+        'previous': previous,
+    }
+
+
+@async_api_view('GET', 'POST')
+async def task_list(request):
+    if request.method == 'POST':
+        return await create_task(request)
+    context = parse_fieldset(request.GET)
+    rows = filter_tasks(request.user, request.GET).order_by(*task_ordering(request.GET)).values(*TASK_VALUES)
+    page, envelope = await paginate(request, rows)
+    return api_response(request, { **envelope, 'results': await aserialize_task_rows(page, context) })
+
+
+@async_api_view('GET')
+async def task_detail(request, pk):
+    context = parse_fieldset(request.GET)
+    row = await Task.objects.filter(pk=pk).values(*TASK_VALUES).afirst()
+    # Other users' tasks are hidden, as TaskViewSet does by scoping its queryset to the user.
+    if row is None or not await ownership.ahas_object_permission(request, None, row):
+        raise exceptions.NotFound()
+    return api_response(request, (await aserialize_task_rows([row], context))[0])
+
+
+async def create_task(request):
+    data = parse_body(request)
+    serializer = BulkTaskSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    data = dict(serializer.validated_data)
+    parent_id = data.pop('parent_task', None)
+    path = ''
+    if parent_id is not None:
+        parent = await Task.objects.filter(pk=parent_id).values('user', 'path').afirst()
+        if parent is None or not await ownership.ahas_object_permission(request, None, parent):
+            raise exceptions.ValidationError({ 'parent_task': 'Tarea padre no encontrada.' })
+        path = f'{parent["path"]}{parent_id}/'
+    names = { tag['name'] for tag in data.pop('tags', []) }
+    task = await Task.objects.acreate(user=request.user, parent_task_id=parent_id, path=path, **data)
+    if names:
+        tags = await aresolve_tags(names)
+        await task.tags.aadd(*tags.values())
+    await apin_to_primary(request.user.pk)
+    row = { name: getattr(task, Task._meta.get_field(name).attname) for name in TASK_VALUES }
+    return api_response(request, (await aserialize_task_rows([row], {}))[0], status=201)
@@ -0,0 +1,117 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    Bounded LRU of users with a TTL, optionally backed by the shared Django cache. Other processes only
+    see an invalidation through the shared tier, so their local copies live at most JWT_USER_CACHE_TTL.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def shared_key(self, user_id):
+        return f'auth:user:{user_id}'
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None:
+                user, expires = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(user_id)
+                    return user
+                del self.entries[user_id]
+        if settings.JWT_USER_CACHE_SHARED:
+            user = cache.get(self.shared_key(user_id))
+            if user is not None:
+                self.set(user_id, user, shared=False)
+            return user
+        return None
+
+    def set(self, user_id, user, shared=True):
+        with self.lock:
+            self.entries[user_id] = (user, time.monotonic() + settings.JWT_USER_CACHE_TTL)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.JWT_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+        if shared and settings.JWT_USER_CACHE_SHARED:
+            cache.set(self.shared_key(user_id), user, settings.JWT_USER_CACHE_TTL)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+        if settings.JWT_USER_CACHE_SHARED:
+            cache.delete(self.shared_key(user_id))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the token's user from `user_cache` instead of one query per request."""
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def check_user(self, user, validated_token):
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        else:
+            self.check_user(user, validated_token)
+        # Requests get their own copy so changes to request.user never leak into the cache.
+        return copy.copy(user)
+
+    async def aauthenticate(self, request):
+        """`authenticate` for async views: token checks are CPU only and the user lookup uses the async ORM."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = await self.user_model.objects.aget(**{ api_settings.USER_ID_FIELD: user_id })
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            self.check_user(user, validated_token)
+            user_cache.set(user_id, user)
+        else:
+            self.check_user(user, validated_token)
+        return copy.copy(user)
@@ -0,0 +1,412 @@
+import asyncio
+import gzip
+import json
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import count
+from wsgiref.util import setup_testing_defaults
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .counters import rebuild_counters
+from .fastpath import TASK_VALUES, serialize_task_rows
+from .models import STATE_CHOICES, Tag, Task
+from .renderers import MessagePackParser, MessagePackRenderer, ORJSONParser, ORJSONRenderer
+from .throttling import auth_buckets
+from .tree import path_under
+
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench-api',
+    }
+}
+
+
+def seed_dataset(users=1, tasks_per_user=1000, tags=50, tags_per_task=2, subtask_depth=0, fanout=0, seed=0,
+                 prefix='bench'):
+    """
+    Insert a deterministic dataset with bulk inserts and return the created users. Every user gets
+    `tasks_per_user` root tasks, each with `fanout` subtasks per level down to `subtask_depth` levels.
+    Passwords are left unusable so seeding does not pay for hashing.
+    """
+    rng = random.Random(seed)
+    states = [choice[0] for choice in STATE_CHOICES]
+    created_users = [User(username=f'{prefix}-user-{i}') for i in range(users)]
+    for user in created_users:
+        user.set_unusable_password()
+    created_users = User.objects.bulk_create(created_users)
+    created_tags = Tag.objects.bulk_create([Tag(name=f'{prefix}-tag-{i}') for i in range(tags)])
+    TaskTag = Task.tags.through
+
+    def create_level(user, parents, count):
+        tasks = Task.objects.bulk_create([
+            Task(
+                title=f'Tarea {i}',
+                user=user,
+                parent_task=parent,
+                path=path_under(parent),
+                state=rng.choice(states),
+                expiration_date=f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            )
+            for parent in parents
+            for i in range(count)
+        ], batch_size=1000)
+        links = [
+            TaskTag(task_id=task.id, tag_id=tag.id)
+            for task in tasks
+            for tag in rng.sample(created_tags, min(tags_per_task, len(created_tags)))
+        ]
+        TaskTag.objects.bulk_create(links, batch_size=1000)
+        return tasks
+
+    for user in created_users:
+        level = create_level(user, [None], tasks_per_user)
+        for _ in range(subtask_depth):
+            level = create_level(user, level, fanout)
+    if subtask_depth and fanout:
+        rebuild_counters(Task.objects.filter(user__in=created_users))
+    return created_users
+
+
+@contextmanager
+def committed_dataset(prefix, **options):
+    """
+    Seed and commit a dataset with `seed_dataset` for benchmarks whose requests run on other threads and
+    connections, yield its users and remove it afterwards.
+    """
+    # Every request needs to hit the database, so responses are never kept in the response cache.
+    with override_settings(
+        CACHES=BENCH_CACHES, ALLOWED_HOSTS=['testserver'], TASKS_CACHE_TIMEOUT=0,
+        REQUEST_INSTRUMENTATION_SAMPLE_RATE=0.0,
+    ):
+        users = seed_dataset(prefix=prefix, **options)
+        try:
+            yield users
+        finally:
+            Task.objects.filter(user__in=users).delete()
+            Tag.objects.filter(name__startswith=f'{prefix}-').delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+
+def timed(fn, repeat=5):
+    """Run `fn` `repeat` times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(timings, pct):
+    ordered = sorted(timings)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summary(timings):
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+    }
+
+
+def measure(client, method, path, data=None, repeat=5, prepare=None):
+    """
+    Issue a request `repeat` times and return its status, query count, timings and allocations.
+    `prepare` builds the (path, data) of each call when every call needs fresh input.
+    """
+    cache.clear()
+    timings = []
+    for _ in range(repeat):
+        call_path, call_data = prepare() if prepare else (path, data)
+        # Repeated signups and logins would otherwise run into the throttling.
+        cache.clear()
+        auth_buckets.clear()
+        start = time.perf_counter()
+        response = getattr(client, method)(call_path, call_data, format='json')
+        timings.append((time.perf_counter() - start) * 1000)
+    call_path, call_data = prepare() if prepare else (path, data)
+    cache.clear()
+    auth_buckets.clear()
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        response = getattr(client, method)(call_path, call_data, format='json')
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'queries': len(queries),
+        **summary(timings),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_api_benchmark(users=1, tasks_per_user=100, tags=50, tags_per_task=2, subtask_depth=2, fanout=2, repeat=5,
+                      seed=0, prefix='bench'):
+    """
+    Seed a dataset and exercise every API endpoint through the test client, returning a report keyed
+    by endpoint. Responses are never served from the response cache, so the full path is measured.
+    """
+    counter = count()
+    user, *_ = seed_dataset(
+        users=users, tasks_per_user=tasks_per_user, tags=tags, tags_per_task=tags_per_task,
+        subtask_depth=subtask_depth, fanout=fanout, seed=seed, prefix=prefix,
+    )
+    user.set_password('bench-password')
+    user.save()
+    client = APIClient()
+    report = {}
+    credentials = { 'username': user.username, 'password': 'bench-password' }
+    report['signup'] = measure(client, 'post', '/api/signup/', repeat=repeat, prepare=lambda: (
+        '/api/signup/', { 'username': f'{prefix}-signup-{next(counter)}', 'password': 'bench-password' }
+    ))
+    report['login'] = measure(client, 'post', '/api/login/', credentials, repeat=repeat)
+    access = client.post('/api/login/', credentials, format='json').data['access']
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    root = Task.objects.filter(user=user, parent_task=None).order_by('id').first()
+    report['task_list'] = measure(client, 'get', '/api/tasks/', repeat=repeat)
+    report['task_filter'] = measure(client, 'get', f'/api/tasks/?state=pending&tags={prefix}-tag-1', repeat=repeat)
+    report['task_detail'] = measure(client, 'get', f'/api/tasks/{root.id}/', repeat=repeat)
+    report['task_create'] = measure(client, 'post', '/api/tasks/', repeat=repeat, prepare=lambda: (
+        '/api/tasks/',
+        { 'title': 'Nueva', 'parent_task': root.id, 'tags': [{ 'name': f'{prefix}-new-{next(counter)}' }] },
+    ))
+    report['tag_list'] = measure(client, 'get', '/api/tags/', repeat=repeat)
+    report['tag_create'] = measure(client, 'post', '/api/tags/', repeat=repeat, prepare=lambda: (
+        '/api/tags/', { 'name': f'{prefix}-tag-new-{next(counter)}' }
+    ))
+    tag = Tag.objects.get(name=f'{prefix}-tag-0')
+    report['tag_detail'] = measure(client, 'get', f'/api/tags/{tag.id}/', repeat=repeat)
+    report['tag_update'] = measure(client, 'put', f'/api/tags/{tag.id}/', repeat=repeat, prepare=lambda: (
+        f'/api/tags/{tag.id}/', { 'name': f'{prefix}-tag-renamed-{next(counter)}' }
+    ))
+    report['tag_delete'] = measure(client, 'delete', None, repeat=repeat, prepare=lambda: (
+        f'/api/tags/{Tag.objects.create(name=f"{prefix}-tag-gone-{next(counter)}").id}/', None
+    ))
+    return report
+
+
+def compare(report, baseline, threshold=0.2):
+    """
+    Regressions of `report` against `baseline`: any extra query, or a p95 latency or allocation
+    peak more than `threshold` (a fraction) above the baseline.
+    """
+    regressions = []
+    for endpoint, result in report.items():
+        previous = baseline.get(endpoint)
+        if previous is None:
+            continue
+        if result['queries'] > previous['queries']:
+            regressions.append(f'{endpoint}: queries {previous["queries"]} -> {result["queries"]}')
+        for metric in ('p95_ms', 'peak_kb'):
+            if result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f'{endpoint}: {metric} {previous[metric]} -> {result[metric]}')
+    return regressions
+
+
+def wsgi_request(application, method, path, headers, body=b'', environ=None):
+    """Run one request through the WSGI application, the way a threaded WSGI server would. Returns the status."""
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': 'testserver',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)), 'wsgi.input': BytesIO(body),
+        **(environ or {}),
+    }
+    environ.update({ f'HTTP_{name.upper().replace("-", "_")}': value for name, value in headers.items() })
+    setup_testing_defaults(environ)
+    status = []
+    result = application(environ, lambda line, response_headers, exc_info=None: status.append(line))
+    try:
+        for _ in result:
+            pass
+    finally:
+        result.close()
+    return int(status[0].split()[0])
+
+
+def wsgi_get(application, path, headers):
+    return wsgi_request(application, 'GET', path, headers)
+
+
+async def asgi_get(application, path, headers):
+    """Run one GET through the ASGI application, the way an ASGI server would. Returns the status."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': { 'version': '3.0' }, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver')] + [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+    }
+    body = [{ 'type': 'http.request', 'body': b'', 'more_body': False }]
+    status = []
+
+    async def receive():
+        if body:
+            return body.pop()
+        # The client stays connected until the response is sent.
+        return await asyncio.get_running_loop().create_future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+def throughput(timings, statuses, elapsed):
+    return {
+        'requests': len(timings),
+        'errors': sum(1 for status in statuses if status != 200),
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        **summary(timings),
+    }
+
+
+def run_wsgi_load(path, headers, requests, concurrency):
+    """Issue `requests` GETs of `path` from `concurrency` threads through the WSGI handler."""
+    application = get_wsgi_application()
+
+    def call(_):
+        start = time.perf_counter()
+        return wsgi_get(application, path, headers), (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+    return throughput([timing for _, timing in results], [status for status, _ in results], elapsed)
+
+
+async def run_asgi_load(path, headers, requests, concurrency):
+    """Issue `requests` GETs of `path`, at most `concurrency` at a time, through the ASGI handler."""
+    application = get_asgi_application()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            start = time.perf_counter()
+            return await asgi_get(application, path, headers), (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return throughput([timing for _, timing in results], [status for status, _ in results], elapsed)
+
+
+def run_concurrency_benchmark(user, requests=200, concurrency=20):
+    """
+    Compare the sync task endpoints served through WSGI with the async ones served through ASGI under
+    `concurrency` simultaneous clients. The data of `user` must be committed, since every request
+    runs on its own thread and database connection.
+    """
+    headers = { 'Authorization': f'Bearer {AccessToken.for_user(user)}' }
+    task = Task.objects.filter(user=user, parent_task=None).order_by('id').first()
+    endpoints = {
+        'task_list': ('/api/tasks/', '/api/async/tasks/'),
+        'task_detail': (f'/api/tasks/{task.id}/', f'/api/async/tasks/{task.id}/'),
+    }
+    report = {}
+    for name, (sync_path, async_path) in endpoints.items():
+        wsgi = run_wsgi_load(sync_path, headers, requests, concurrency)
+        asgi = asyncio.run(run_asgi_load(async_path, headers, requests, concurrency))
+        report[name] = {
+            'wsgi': wsgi,
+            'asgi': asgi,
+            'speedup': round(asgi['requests_per_second'] / wsgi['requests_per_second'], 2),
+        }
+    return report
+
+
+def run_login_flood_benchmark(user, requests=200, concurrency=4, flood_threads=8, flood_ips=4, flood_rate=20,
+                              warmup=3.0):
+    """
+    Measure the task list latency of `concurrency` clients of `user` before and during a flood of failed
+    logins: `flood_threads` threads, each sending up to `flood_rate` attempts per second from one of
+    `flood_ips` client addresses, with the signup/login throttling as configured. The flood runs for
+    `warmup` seconds before measuring, so the allowed bursts are spent. The data of `user` must be committed.
+    """
+    application = get_wsgi_application()
+    headers = { 'Authorization': f'Bearer {AccessToken.for_user(user)}' }
+    baseline = run_wsgi_load('/api/tasks/', headers, requests, concurrency)
+    auth_buckets.clear()
+    stop = threading.Event()
+    statuses = []
+
+    def flood(thread):
+        body = json.dumps({ 'username': user.username, 'password': 'wrong-password' }).encode()
+        environ = { 'REMOTE_ADDR': f'10.0.0.{thread % flood_ips + 1}' }
+        # Paced like remote clients; an unpaced loop would only measure contention for the GIL.
+        while not stop.wait(1 / flood_rate):
+            statuses.append(wsgi_request(application, 'POST', '/api/login/', {}, body, environ))
+
+    threads = [threading.Thread(target=flood, args=(thread,)) for thread in range(flood_threads)]
+    for thread in threads:
+        thread.start()
+    try:
+        stop.wait(warmup)
+        during = run_wsgi_load('/api/tasks/', headers, requests, concurrency)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return {
+        'baseline': baseline,
+        'during_flood': during,
+        'p95_slowdown': round(during['p95_ms'] / baseline['p95_ms'], 2),
+        'flood': {
+            'requests': len(statuses),
+            'throttled': statuses.count(429),
+            'rejected_credentials': statuses.count(401),
+        },
+    }
+
+
+RENDERERS = {
+    'json': (JSONRenderer(), JSONParser()),
+    'orjson': (ORJSONRenderer(), ORJSONParser()),
+    'msgpack': (MessagePackRenderer(), MessagePackParser()),
+}
+
+
+def run_renderer_benchmark(user, page_size=100, repeat=20):
+    """
+    Encode and decode a task list page of `user` (`page_size` root tasks with their whole subtrees and
+    tags) with every renderer and its parser. Reports timings, raw and gzipped payload sizes, whether the
+    payload decodes back to the same data, and the ratios against DRF's JSONRenderer.
+    """
+    rows = Task.objects.filter(user=user, parent_task=None).order_by('id').values(*TASK_VALUES)[:page_size]
+    data = { 'count': page_size, 'next': None, 'previous': None, 'results': serialize_task_rows(rows, {}) }
+    report = {}
+    for name, (renderer, parser) in RENDERERS.items():
+        content = renderer.render(data)
+        report[name] = {
+            'bytes': len(content),
+            'gzip_bytes': len(gzip.compress(content)),
+            'round_trip': parser.parse(BytesIO(content)) == data,
+            'encode': summary(timed(lambda: renderer.render(data), repeat)),
+            'decode': summary(timed(lambda: parser.parse(BytesIO(content)), repeat)),
+        }
+    baseline = report['json']
+    for result in report.values():
+        result['encode_speedup'] = round(baseline['encode']['p50_ms'] / result['encode']['p50_ms'], 2)
+        result['size_ratio'] = round(result['bytes'] / baseline['bytes'], 3)
+    return report
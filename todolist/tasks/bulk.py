@@ -0,0 +1,203 @@
+from collections import Counter
+from django.db import transaction
+from django.utils import timezone
+from .cache import bump_version
+from .counters import COMPLETE, add_delta, apply_deltas, targets, weight
+from .models import Tag, Task
+from .serializers import BulkOperationSerializer, BulkTaskSerializer
+from .tree import CYCLE_ERROR, delete_subtrees, move_subtree, path_under, subtree
+from .usage import apply_usage, link_counts
+
+
+def resolve_tags(names):
+    """Map every tag name to its Tag with one lookup plus one upsert for the missing names."""
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = [Tag(name=name) for name in names if name not in tags]
+    if missing:
+        created = Tag.objects.bulk_create(
+            missing, update_conflicts=True, unique_fields=['name'], update_fields=['name']
+        )
+        tags.update({tag.name: tag for tag in created})
+    return tags
+
+
+async def aresolve_tags(names):
+    """Async ORM version of `resolve_tags`."""
+    tags = {tag.name: tag async for tag in Tag.objects.filter(name__in=names)}
+    missing = [Tag(name=name) for name in names if name not in tags]
+    if missing:
+        created = await Tag.objects.abulk_create(
+            missing, update_conflicts=True, unique_fields=['name'], update_fields=['name']
+        )
+        tags.update({tag.name: tag for tag in created})
+    return tags
+
+
+def set_tags(user_id, names_by_task, tags, replace_ids=()):
+    """
+    Write the tag links of tasks of `user_id` in one delete (for the replaced ones) and one insert, and
+    count them in the tag usage.
+    """
+    TaskTag = Task.tags.through
+    if replace_ids:
+        replaced = TaskTag.objects.filter(task_id__in=replace_ids)
+        apply_usage(link_counts(replaced), sign=-1)
+        replaced.delete()
+    links = [
+        TaskTag(task_id=task_id, tag_id=tags[name].id)
+        for task_id, names in names_by_task.items()
+        for name in set(names)
+    ]
+    TaskTag.objects.bulk_create(links, ignore_conflicts=True)
+    # The tasks are either new or just lost their links, so none of these links was there before.
+    apply_usage(Counter((user_id, link.tag_id) for link in links))
+
+
+def apply_bulk_operations(user, operations):
+    """
+    Validate and apply a list of create/update/delete operations on the tasks of `user`.
+    Invalid items are reported in their result entry and skipped; the valid ones are applied together.
+    """
+    results = [{ 'index': index } for index in range(len(operations))]
+    envelopes = []
+    for result, operation in zip(results, operations):
+        serializer = BulkOperationSerializer(data=operation)
+        if serializer.is_valid():
+            envelopes.append((result, serializer.validated_data))
+        else:
+            result.update(status='error', errors=serializer.errors)
+
+    referenced_ids = {item['id'] for result, item in envelopes if 'id' in item}
+    referenced_ids |= {
+        item['data']['parent_task'] for result, item in envelopes
+        if isinstance(item['data'].get('parent_task'), int)
+    }
+    owned = Task.objects.filter(user=user, id__in=referenced_ids).in_bulk()
+
+    creates, updates, deletes = [], [], []
+    for result, item in envelopes:
+        result['op'] = item['op']
+        if item['op'] != 'create':
+            result['id'] = item['id']
+            if item['id'] not in owned:
+                result.update(status='error', errors={ 'id': 'Tarea no encontrada.' })
+                continue
+        if item['op'] == 'delete':
+            deletes.append((result, item['id']))
+            continue
+        serializer = BulkTaskSerializer(data=item['data'], partial=item['op'] == 'update')
+        if not serializer.is_valid():
+            result.update(status='error', errors=serializer.errors)
+            continue
+        data = dict(serializer.validated_data)
+        parent_id = data.pop('parent_task', None)
+        if parent_id is not None and parent_id not in owned:
+            result.update(status='error', errors={ 'parent_task': 'Tarea padre no encontrada.' })
+            continue
+        if 'parent_task' in serializer.validated_data:
+            data['parent_task_id'] = parent_id
+        if item['op'] == 'create':
+            creates.append((result, data))
+        else:
+            updates.append((result, owned[item['id']], data))
+
+    tag_names = {
+        tag['name']
+        for _, data in creates + [(result, data) for result, task, data in updates]
+        for tag in data.get('tags', [])
+    }
+
+    with transaction.atomic():
+        tags = resolve_tags(tag_names) if tag_names else {}
+
+        new_tasks = Task.objects.bulk_create([
+            Task(
+                user=user,
+                path=path_under(owned.get(data.get('parent_task_id'))),
+                **{ key: value for key, value in data.items() if key != 'tags' }
+            )
+            for result, data in creates
+        ])
+        deltas = {}
+        tagged, retagged = [], []
+        for (result, data), task in zip(creates, new_tasks):
+            add_delta(deltas, targets(task.parent_task_id, task.path), *weight(task.state))
+            result.update(id=task.id, status='ok')
+            if data.get('tags'):
+                tagged.append((task.id, [tag['name'] for tag in data['tags']]))
+
+        # bulk_update() skips auto_now, so the modification timestamp is set here.
+        now = timezone.now()
+        update_fields = { 'updated_at' }
+        updated = []
+        state_changes = {}
+        for result, task, data in updates:
+            # Reparents run one by one on fresh paths, so moves within one request cannot build a cycle.
+            parent_id = data.pop('parent_task_id', task.parent_task_id)
+            if parent_id != task.parent_task_id and not move_subtree(task.id, parent_id):
+                result.update(status='error', errors={ 'parent_task': CYCLE_ERROR })
+                continue
+            task.parent_task_id = parent_id
+            task.updated_at = now
+            if data.get('state', task.state) != task.state:
+                state_changes[task.id] = int(data['state'] == COMPLETE) - int(task.state == COMPLETE)
+            for key, value in data.items():
+                if key != 'tags':
+                    setattr(task, key, value)
+                    update_fields.add(key)
+            if 'tags' in data:
+                retagged.append((task.id, [tag['name'] for tag in data['tags']]))
+            result['status'] = 'ok'
+            updated.append(task)
+        if updated:
+            Task.objects.bulk_update(updated, update_fields)
+        if state_changes:
+            # Read after the moves above, which may have changed the targets.
+            for task_id, parent_id, path in Task.objects.filter(id__in=state_changes).values_list(
+                'id', 'parent_task_id', 'path'
+            ):
+                add_delta(deltas, targets(parent_id, path), 0, state_changes[task_id])
+        apply_deltas(deltas)
+
+        if tagged or retagged:
+            set_tags(user.pk, dict(tagged + retagged), tags, replace_ids=[task_id for task_id, names in retagged])
+
+        if deletes:
+            delete_subtrees(Task.objects.filter(user=user, id__in=[task_id for result, task_id in deletes]))
+            for result, task_id in deletes:
+                result['status'] = 'ok'
+        # bulk_create/bulk_update and the raw tag links do not send model signals.
+        if creates or updates:
+            bump_version(user.pk)
+    return results
+
+
+def transition_tasks(user, queryset, state, include_subtasks=False):
+    """
+    Move the tasks of `queryset` (and their descendants if `include_subtasks`) that belong to `user` to
+    `state` with a single UPDATE and return how many changed. Like the other bulk writes it sends no
+    model signals, so the counters and the response cache are updated here.
+    """
+    with transaction.atomic():
+        if include_subtasks:
+            roots = list(queryset.only('id', 'path'))
+            scope = Task.objects.filter(subtree(roots)) if roots else Task.objects.none()
+        else:
+            scope = Task.objects.filter(id__in=queryset.order_by().values('id'))
+        # Locked so the counters below match exactly the rows the UPDATE changes.
+        rows = list(
+            scope.filter(user=user).exclude(state=state).select_for_update().values_list(
+                'id', 'parent_task_id', 'path', 'state'
+            )
+        )
+        if not rows:
+            return 0
+        updated = Task.objects.filter(id__in=[row[0] for row in rows]).update(
+            state=state, updated_at=timezone.now()
+        )
+        deltas = {}
+        for task_id, parent_id, path, previous in rows:
+            add_delta(deltas, targets(parent_id, path), 0, int(state == COMPLETE) - int(previous == COMPLETE))
+        apply_deltas(deltas)
+        bump_version(user.pk)
+    return updated
@@ -0,0 +1,63 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+TAGS_SCOPE = 'tags'
+
+
+def version_key(scope):
+    return f'tasks:version:{scope}'
+
+
+def get_version(scope):
+    """
+    Current version of `scope` (a user id or TAGS_SCOPE). A missing version starts from the clock so an
+    evicted counter never comes back to a value that older entries were stored under.
+    """
+    key = version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(scope):
+    def bump():
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            cache.set(version_key(scope), time.time_ns(), None)
+    # Bumping again after commit keeps a reader that ran between both bumps from caching stale rows.
+    bump()
+    transaction.on_commit(bump)
+
+
+def response_key(request, name):
+    params = sorted(request.query_params.lists())
+    digest = hashlib.sha1(repr((request.get_host(), request.path, params)).encode()).hexdigest()
+    return (
+        f'tasks:response:{request.user.pk}:{get_version(request.user.pk)}:{get_version(TAGS_SCOPE)}:'
+        f'{name}:{digest}'
+    )
+
+
+def cached_response(request, name, build_response):
+    """
+    Serve a successful response of the view `name` from the cache or build and store it. The X-Cache header
+    tells which; the request instrumentation counts it per route (todolist.middleware).
+    """
+    key = response_key(request, name)
+    data = cache.get(key)
+    if data is not None:
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.TASKS_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
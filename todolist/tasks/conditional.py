@@ -0,0 +1,63 @@
+import hashlib
+from django.db.models import Count, Max, Q
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from .models import Tag, Task
+
+
+def make_etag(request, *parts):
+    # Every representation (JSON, MessagePack) gets its own validator.
+    parts = (getattr(request, 'accepted_media_type', None), *parts)
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def tag_state():
+    tags = Tag.objects.aggregate(updated=Max('updated_at'), count=Count('id'))
+    return tags['updated'], tags['count']
+
+
+def task_etag(request, pk=None):
+    """
+    Validator for the task list/detail of the current user: every write bumps the user's max(updated_at)
+    or row count, and tag changes bump the tag ones. Returns None for a detail the user does not own.
+    """
+    if pk is not None and not str(pk).isdigit():
+        return None
+    aggregates = { 'updated': Max('updated_at'), 'count': Count('id') }
+    if pk is not None:
+        aggregates['owned'] = Count('id', filter=Q(pk=pk))
+    tasks = Task.objects.filter(user=request.user).aggregate(**aggregates)
+    if pk is not None and not tasks['owned']:
+        return None
+    params = sorted(request.query_params.lists())
+    return make_etag(request, 'tasks', pk, params, tasks['updated'], tasks['count'], tag_state())
+
+
+def tag_etag(request, pk=None):
+    """Validator for the tag list/detail. Returns None for a detail of a tag that does not exist."""
+    if pk is None:
+        return make_etag(request, 'tags', pk, sorted(request.query_params.lists()), tag_state())
+    if not str(pk).isdigit():
+        return None
+    tags = Tag.objects.aggregate(updated=Max('updated_at'), count=Count('id'), found=Count('id', filter=Q(pk=pk)))
+    if not tags['found']:
+        return None
+    return make_etag(request, 'tags', pk, sorted(request.query_params.lists()), (tags['updated'], tags['count']))
+
+
+def conditional_response(request, etag, build_response):
+    """Answer 304 when If-None-Match matches `etag`, otherwise build the response and tag it."""
+    if etag is None:
+        return build_response()
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED, headers={ 'ETag': etag })
+        patch_vary_headers(response, ['Accept'])
+        return response
+    response = build_response()
+    if response.status_code == 200:
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept'])
+    return response
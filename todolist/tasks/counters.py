@@ -0,0 +1,115 @@
+"""
+Denormalized subtask counters.
+
+Every task stores how many subtasks it has and how many of them are complete. With
+TASKS_SUBTASK_ROLLUP the counters cover all descendants instead of the direct subtasks only. Writers
+collect deltas per target task and apply them with `apply_deltas` in their own transaction;
+`rebuild_counters` recomputes them from scratch.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from .models import Task
+
+COMPLETE = 'complete'
+COUNTER_FIELDS = ['subtask_count', 'completed_subtask_count']
+
+
+def targets(parent_id, path):
+    """Ids of the tasks whose counters include a task with this parent and path."""
+    if parent_id is None:
+        return []
+    if settings.TASKS_SUBTASK_ROLLUP:
+        return [int(ancestor_id) for ancestor_id in path.split('/') if ancestor_id]
+    return [parent_id]
+
+
+def weight(state, subtask_count=0, completed_subtask_count=0):
+    """What one task adds to the (count, completed) counters of its targets."""
+    if settings.TASKS_SUBTASK_ROLLUP:
+        return 1 + subtask_count, int(state == COMPLETE) + completed_subtask_count
+    return 1, int(state == COMPLETE)
+
+
+def add_delta(deltas, task_ids, count, completed, sign=1):
+    for task_id in task_ids:
+        current = deltas.get(task_id, (0, 0))
+        deltas[task_id] = (current[0] + sign * count, current[1] + sign * completed)
+
+
+def apply_deltas(deltas):
+    """Apply a {task id: (count delta, completed delta)} map with one UPDATE per distinct delta."""
+    groups = {}
+    for task_id, delta in deltas.items():
+        if delta != (0, 0):
+            groups.setdefault(delta, []).append(task_id)
+    for (count, completed), task_ids in groups.items():
+        Task.objects.filter(id__in=task_ids).update(
+            subtask_count=F('subtask_count') + count,
+            completed_subtask_count=F('completed_subtask_count') + completed,
+        )
+
+
+def expected_counters(tasks):
+    """
+    {task id: (count, completed)} recomputed from the subtasks of `tasks`, (id, path) pairs, in one query:
+    grouped by parent, or with TASKS_SUBTASK_ROLLUP over the rows under the constant path prefix of every task.
+    """
+    expected = { task_id: (0, 0) for task_id, path in tasks }
+    if not settings.TASKS_SUBTASK_ROLLUP:
+        subtasks = Task.objects.filter(parent_task_id__in=expected).order_by().values('parent_task_id').annotate(
+            count=Count('id'), completed=Count('id', filter=Q(state=COMPLETE))
+        )
+        for parent_id, count, completed in subtasks.values_list('parent_task_id', 'count', 'completed'):
+            expected[parent_id] = (count, completed)
+        return expected
+    # Tasks below another one of the batch are already covered by its prefix.
+    condition = Q()
+    for task_id, path in tasks:
+        if not any(int(ancestor_id) in expected for ancestor_id in path.split('/') if ancestor_id):
+            condition |= Q(path__startswith=f'{path}{task_id}/')
+    deltas = {}
+    for path, state in Task.objects.filter(condition).values_list('path', 'state').iterator():
+        ancestor_ids = [int(ancestor_id) for ancestor_id in path.split('/') if ancestor_id]
+        add_delta(deltas, [task_id for task_id in ancestor_ids if task_id in expected], 1, int(state == COMPLETE))
+    return { **expected, **deltas }
+
+
+def rebuild_counters(queryset=None, batch_size=1000, fix=True):
+    """
+    Recompute the counters of `queryset` (every task by default) in batches of `batch_size` ids, writing
+    back the ones that drifted unless `fix` is False. Each batch runs in its own transaction. Returns the
+    number of checked tasks and the drifted ones as (id, stored, expected) tuples.
+    """
+    queryset = (Task.objects.all() if queryset is None else queryset).order_by('id')
+    if fix:
+        # Deltas applied to the batch between the count and the write back would be overwritten otherwise.
+        queryset = queryset.select_for_update()
+    checked = 0
+    drifted = []
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                queryset.filter(id__gt=last_id).values_list(
+                    'id', 'path', 'subtask_count', 'completed_subtask_count'
+                )[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            checked += len(batch)
+            expected = expected_counters([(task_id, path) for task_id, path, count, completed in batch])
+            stale = [
+                (task_id, (count, completed), expected[task_id])
+                for task_id, path, count, completed in batch
+                if (count, completed) != expected[task_id]
+            ]
+            if stale and fix:
+                Task.objects.bulk_update([
+                    Task(id=task_id, subtask_count=expected[0], completed_subtask_count=expected[1])
+                    for task_id, stored, expected in stale
+                ], COUNTER_FIELDS)
+        drifted.extend(stale)
+    return checked, drifted
@@ -0,0 +1,44 @@
+import csv
+import json
+from django.conf import settings
+
+CSV_COLUMNS = ['id', 'title', 'description', 'expiration_date', 'state', 'parent_task', 'tags']
+TAG_SEPARATOR = '|'
+
+
+def export_rows(queryset):
+    """Yield one flat dict per task, reading with a server-side cursor and prefetching tags per chunk."""
+    for task in queryset.prefetch_related('tags').iterator(chunk_size=settings.TASKS_EXPORT_CHUNK_SIZE):
+        yield {
+            'id': task.id,
+            'title': task.title,
+            'description': task.description,
+            'expiration_date': task.expiration_date.isoformat() if task.expiration_date else None,
+            'state': task.state,
+            'parent_task': task.parent_task_id,
+            'tags': [{ 'name': tag.name } for tag in task.tags.all()],
+        }
+
+
+def ndjson_lines(queryset):
+    for row in export_rows(queryset):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in export_rows(queryset):
+        row['tags'] = TAG_SEPARATOR.join(tag['name'] for tag in row['tags'])
+        yield writer.writerow([row[column] if row[column] is not None else '' for column in CSV_COLUMNS])
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'csv': ('text/csv', csv_lines),
+}
@@ -0,0 +1,31 @@
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import STATE_CHOICES, Task
+
+EXPIRATION_BUCKETS = ['overdue', 'upcoming', 'none']
+
+
+def task_facets(queryset, today=None):
+    """
+    Counts of the tasks in `queryset` per state, per expiration bucket and per tag name: one aggregate
+    query for the states and buckets and one grouped query over the tag links.
+    """
+    today = today or timezone.localdate()
+    conditions = {
+        **{ f'state_{state}': Q(state=state) for state, label in STATE_CHOICES },
+        'expiration_overdue': Q(expiration_date__lt=today),
+        'expiration_upcoming': Q(expiration_date__gte=today),
+        'expiration_none': Q(expiration_date__isnull=True),
+    }
+    totals = queryset.order_by().aggregate(
+        total=Count('id'), **{ key: Count('id', filter=condition) for key, condition in conditions.items() }
+    )
+    tags = Task.tags.through.objects.filter(
+        task_id__in=queryset.order_by().values('id')
+    ).values_list('tag__name').annotate(count=Count('task_id')).order_by('-count', 'tag__name')
+    return {
+        'count': totals['total'],
+        'state': { state: totals[f'state_{state}'] for state, label in STATE_CHOICES },
+        'expiration_date': { bucket: totals[f'expiration_{bucket}'] for bucket in EXPIRATION_BUCKETS },
+        'tags': { name: count for name, count in tags },
+    }
@@ -0,0 +1,83 @@
+from django.db.models.expressions import RawSQL
+from .models import Task
+from .serializers import TaskSerializer, includes_field
+from .tree import descendants_sql
+
+TASK_VALUES = [
+    'id', 'title', 'description', 'expiration_date', 'state', 'user', 'parent_task',
+    'subtask_count', 'completed_subtask_count',
+]
+
+
+def task_fields(context):
+    return [name for name in TaskSerializer.Meta.fields if includes_field(context, name)]
+
+
+def descendant_rows(rows, context):
+    """Queryset of the `.values()` rows of every descendant of `rows`, or None when subtasks are not needed."""
+    if 'subtasks' not in task_fields(context) or not rows:
+        return None
+    root_ids = [row['id'] for row in rows]
+    return Task.objects.filter(
+        id__in=RawSQL(*descendants_sql(root_ids, context.get('depth')))
+    ).order_by('id').values(*TASK_VALUES)
+
+
+def tag_pairs(task_ids):
+    """(task id, tag name) pairs of every task in one query over the M2M table, in the Tag model ordering."""
+    return Task.tags.through.objects.filter(
+        task_id__in=task_ids
+    ).order_by('tag__name', 'tag_id').values_list('task_id', 'tag__name')
+
+
+def build_task_tree(rows, descendants, pairs, context):
+    """Assemble the TaskSerializer output for `rows` from already fetched descendants and tag pairs."""
+    fields = task_fields(context)
+    children = {}
+    for row in descendants:
+        children.setdefault(row['parent_task'], []).append(row)
+    tags = {}
+    for task_id, name in pairs:
+        tags.setdefault(task_id, []).append({ 'name': name })
+
+    def build(row, depth):
+        data = {}
+        for name in fields:
+            if name == 'subtasks':
+                if depth == 0:
+                    continue
+                child_depth = None if depth is None else depth - 1
+                data[name] = [build(child, child_depth) for child in children.get(row['id'], [])]
+            elif name == 'tags':
+                data[name] = tags.get(row['id'], [])
+            elif name == 'expiration_date':
+                data[name] = row[name].isoformat() if row[name] else None
+            else:
+                data[name] = row[name]
+        return data
+
+    return [build(row, context.get('depth')) for row in rows]
+
+
+def serialize_task_rows(rows, context):
+    """
+    Build the TaskSerializer output for `rows` (dicts from `.values(*TASK_VALUES)`) without model
+    instances or serializer fields: one query for the subtree and one for the tags of every row.
+    """
+    rows = list(rows)
+    queryset = descendant_rows(rows, context)
+    descendants = list(queryset) if queryset is not None else []
+    pairs = []
+    if 'tags' in task_fields(context) and rows:
+        pairs = list(tag_pairs([row['id'] for row in rows + descendants]))
+    return build_task_tree(rows, descendants, pairs, context)
+
+
+async def aserialize_task_rows(rows, context):
+    """Async ORM version of `serialize_task_rows`."""
+    queryset = descendant_rows(rows, context)
+    descendants = [row async for row in queryset] if queryset is not None else []
+    pairs = []
+    if 'tags' in task_fields(context) and rows:
+        pairs = [pair async for pair in tag_pairs([row['id'] for row in rows + descendants])]
+    return build_task_tree(rows, descendants, pairs, context)
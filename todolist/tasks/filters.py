@@ -0,0 +1,41 @@
+from django.db.models import Q
+from .models import Task, TaskArchive
+from .search import search_tasks
+
+
+def filter_fields(queryset, query_params):
+    params = {}
+    state = query_params.get('state', None)
+    if state:
+        params['state'] = state
+    expiration_date = query_params.get('expiration_date', None)
+    if expiration_date:
+        params['expiration_date'] = expiration_date
+    queryset = queryset.filter(**params)
+    tags = query_params.getlist('tags')
+    if tags:
+        queryset = queryset.filter(tags__name__in=tags).distinct()
+    return queryset
+
+
+def filter_tasks(user, query_params):
+    """Tasks of `user` narrowed by the `state`, `expiration_date`, `tags` and `q` query parameters."""
+    queryset = filter_fields(Task.objects.filter(user=user), query_params)
+    search = query_params.get('q', '').strip()
+    if search:
+        queryset = search_tasks(queryset, search)
+    return queryset
+
+
+def filter_archived(user, query_params):
+    """Archived tasks of `user` narrowed by the same parameters; `q` is an unindexed substring match here."""
+    queryset = filter_fields(TaskArchive.objects.filter(user=user), query_params)
+    search = query_params.get('q', '').strip()
+    if search:
+        queryset = queryset.filter(Q(title__icontains=search) | Q(description__icontains=search))
+    return queryset
+
+
+def task_ordering(query_params):
+    """Best matches first for searches, id order otherwise."""
+    return ['-rank', 'id'] if query_params.get('q', '').strip() else ['id']
@@ -0,0 +1,258 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from .bulk import resolve_tags, set_tags
+from .cache import bump_version
+from .counters import add_delta, apply_deltas, targets, weight
+from .export import TAG_SEPARATOR
+from .models import Task, TaskImportKey
+from .serializers import BulkTaskSerializer
+from .tree import move_subtree
+
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportReadError(Exception):
+    """The file stopped being readable as text in the expected format; the rows before it are kept."""
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        row = { key: value for key, value in row.items() if value != '' }
+        if 'tags' in row:
+            row['tags'] = [{ 'name': name } for name in row['tags'].split(TAG_SEPARATOR) if name]
+        yield row
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+def read_rows(file, input_format):
+    """
+    Parse an uploaded or opened binary file incrementally, one row at a time. A leading BOM is skipped;
+    bytes that are not UTF-8 and malformed CSV raise ImportReadError when the reader gets to them.
+    """
+    number = 0
+    try:
+        for number, row in enumerate(READERS[input_format](
+            io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        ), start=1):
+            yield row
+    except UnicodeDecodeError:
+        raise ImportReadError(f'El fichero no está en UTF-8 (después de la fila {number}).')
+    except csv.Error as error:
+        raise ImportReadError(f'CSV no válido después de la fila {number}: {error}.')
+
+
+def external_ref(value):
+    return None if value in (None, '') else str(value)
+
+
+def normalize_tags(tags):
+    if not isinstance(tags, list):
+        return tags
+    return [{ 'name': tag } if isinstance(tag, str) else tag for tag in tags]
+
+
+def link_parents(task_import):
+    """
+    Point every imported task whose parent has been imported by now to that parent. A link that would
+    close a cycle is left pending and ends up reported in `unresolved_parents`.
+    """
+    parents = TaskImportKey.objects.filter(
+        task_import=task_import, external_id=OuterRef('parent_external_id')
+    ).values('task_id')[:1]
+    pending = list(
+        TaskImportKey.objects.filter(task_import=task_import, parent_external_id__isnull=False)
+        .annotate(parent_id=Subquery(parents))
+        .filter(parent_id__isnull=False)
+        .values_list('id', 'task_id', 'parent_id')
+    )
+    # Moves run one by one on fresh paths, so links within the file can never build a cycle.
+    linked = [key_id for key_id, task_id, parent_id in pending if move_subtree(task_id, parent_id)]
+    if linked:
+        TaskImportKey.objects.filter(id__in=linked).update(parent_external_id=None)
+
+
+def create_tasks(task_import, valid):
+    """
+    Insert the validated rows, parents before children, and return (row, task) pairs. Rows whose parent
+    comes later in the file are inserted as roots and keep their parent reference for `link_parents`.
+    """
+    parent_refs = { parent_external_id for _, _, parent_external_id, _ in valid if parent_external_id is not None }
+    # external id -> (task id, path of its children)
+    known = {
+        external_id: (task_id, f'{path}{task_id}/')
+        for external_id, task_id, path in TaskImportKey.objects.filter(
+            task_import=task_import, external_id__in=parent_refs
+        ).values_list('external_id', 'task_id', 'task__path')
+    } if parent_refs else {}
+    in_batch = { external_id for _, external_id, _, _ in valid if external_id is not None }
+    created = []
+    deltas = {}
+    pending = valid
+    while pending:
+        ready, waiting = [], []
+        for item in pending:
+            parent_external_id = item[2]
+            if parent_external_id is None or parent_external_id in known or parent_external_id not in in_batch:
+                ready.append(item)
+            else:
+                waiting.append(item)
+        if not ready:
+            # The rows left wait on each other in a cycle; they go in as roots and link_parents rejects them.
+            ready, waiting = waiting, []
+        tasks = Task.objects.bulk_create([
+            Task(
+                user_id=task_import.user_id,
+                parent_task_id=known[parent_external_id][0] if parent_external_id in known else None,
+                path=known[parent_external_id][1] if parent_external_id in known else '',
+                **{ key: value for key, value in data.items() if key not in ('tags', 'parent_task') }
+            )
+            for number, external_id, parent_external_id, data in ready
+        ])
+        for item, task in zip(ready, tasks):
+            add_delta(deltas, targets(task.parent_task_id, task.path), *weight(task.state))
+            created.append((item, task))
+            if item[1] is not None:
+                known[item[1]] = (task.id, task.subtree_path)
+        pending = waiting
+    apply_deltas(deltas)
+    return created
+
+
+def import_batch(task_import, batch):
+    """
+    Validate a batch of (row number, row) pairs and insert the valid ones in one transaction.
+    Returns the number of created tasks and the errors of the rejected rows.
+    """
+    errors = []
+    valid = []
+    seen = set()
+    for number, row in batch:
+        if not isinstance(row, dict):
+            errors.append({ 'row': number, 'errors': { 'non_field_errors': ['Fila no válida.'] } })
+            continue
+        row = dict(row)
+        external_id = external_ref(row.pop('id', None))
+        parent_external_id = external_ref(row.pop('parent_task', None))
+        if 'tags' in row:
+            row['tags'] = normalize_tags(row['tags'])
+        serializer = BulkTaskSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({ 'row': number, 'errors': serializer.errors })
+        elif external_id is not None and external_id == parent_external_id:
+            errors.append(
+                { 'row': number, 'errors': { 'parent_task': 'Una tarea no puede ser su propia tarea padre.' } }
+            )
+        elif external_id is not None and external_id in seen:
+            errors.append({ 'row': number, 'errors': { 'id': 'Id repetido en el fichero.' } })
+        else:
+            if external_id is not None:
+                seen.add(external_id)
+            valid.append((number, external_id, parent_external_id, serializer.validated_data))
+
+    with transaction.atomic():
+        duplicated = set(TaskImportKey.objects.filter(
+            task_import=task_import, external_id__in=seen
+        ).values_list('external_id', flat=True)) if seen else set()
+        if duplicated:
+            for number, external_id, parent_external_id, data in valid:
+                if external_id in duplicated:
+                    errors.append({ 'row': number, 'errors': { 'id': 'Id ya importado.' } })
+            valid = [item for item in valid if item[1] not in duplicated]
+
+        names = { tag['name'] for *_, data in valid for tag in data.get('tags', []) }
+        tags = resolve_tags(names) if names else {}
+        created = create_tasks(task_import, valid)
+        tagged = {
+            task.id: [tag['name'] for tag in data['tags']]
+            for (number, external_id, parent_external_id, data), task in created if data.get('tags')
+        }
+        if tagged:
+            set_tags(task_import.user_id, tagged, tags)
+        TaskImportKey.objects.bulk_create([
+            TaskImportKey(
+                task_import=task_import,
+                external_id=external_id,
+                parent_external_id=parent_external_id if task.parent_task_id is None else None,
+                task=task,
+            )
+            for (number, external_id, parent_external_id, data), task in created
+            if external_id is not None or (parent_external_id is not None and task.parent_task_id is None)
+        ])
+        link_parents(task_import)
+        task_import.rows_done += len(batch)
+        task_import.save(update_fields=['rows_done', 'updated_at'])
+    bump_version(task_import.user_id)
+    return len(created), errors
+
+
+def run_import(task_import, rows, batch_size, max_rows=None):
+    """
+    Import `rows` into `task_import` in transactional batches of `batch_size`, skipping the rows that a
+    previous run already committed. Every committed batch is a checkpoint: a run stopped by `max_rows`
+    or by a failure resumes from `task_import.rows_done`.
+    """
+    start = time.perf_counter()
+    rows = enumerate(islice(rows, task_import.rows_done, None), start=task_import.rows_done + 1)
+    if max_rows is not None:
+        rows = islice(rows, max_rows)
+    processed = created = error_count = 0
+    errors = []
+    failure = None
+    exhausted = False
+    while not exhausted:
+        try:
+            batch = list(islice(rows, batch_size))
+        except ImportReadError as error:
+            # The batches committed so far stay; the report points at the checkpoint to resume from.
+            failure = str(error)
+            break
+        exhausted = len(batch) < batch_size
+        if batch:
+            batch_created, batch_errors = import_batch(task_import, batch)
+            created += batch_created
+            processed += len(batch)
+            error_count += len(batch_errors)
+            errors.extend(batch_errors[:MAX_REPORTED_ERRORS - len(errors)])
+    if failure is not None:
+        unresolved = None
+    elif max_rows is None or processed < max_rows:
+        task_import.completed = True
+        task_import.save(update_fields=['completed', 'updated_at'])
+        unresolved = task_import.keys.filter(parent_external_id__isnull=False).count()
+        task_import.keys.all().delete()
+    else:
+        unresolved = None
+    elapsed = time.perf_counter() - start
+    report = {
+        'import': task_import.id,
+        'rows': processed,
+        'created': created,
+        'error_count': error_count,
+        'errors': errors,
+        'unresolved_parents': unresolved,
+        'checkpoint': task_import.rows_done,
+        'completed': task_import.completed,
+        'rows_per_second': round(processed / elapsed, 1) if elapsed else None,
+    }
+    if failure is not None:
+        report['error'] = failure
+    return report
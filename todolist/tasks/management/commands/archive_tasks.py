@@ -0,0 +1,37 @@
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from tasks.archive import archive_batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves task trees whose tasks are all complete and untouched for --days into the archive, in '
+        'transactional batches of --batch-size candidate roots. Interrupted runs can go on from the reported last_id.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TASKS_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.TASKS_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--after-id', type=int, default=0, help='Only look at root tasks after this id.')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        last_id = options['after_id']
+        batches = trees = tasks = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            batch_last_id, batch_trees, batch_tasks = archive_batch(cutoff, last_id, options['batch_size'])
+            if batch_last_id is None:
+                break
+            last_id = batch_last_id
+            batches += 1
+            trees += batch_trees
+            tasks += batch_tasks
+            if options['verbosity'] > 1:
+                self.stderr.write(f'Batch {batches}: {batch_trees} trees, {batch_tasks} tasks, last id {last_id}')
+        self.stdout.write(json.dumps({
+            'batches': batches, 'trees': trees, 'tasks': tasks, 'last_id': last_id
+        }, indent=2))
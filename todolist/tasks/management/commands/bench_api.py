@@ -0,0 +1,45 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from tasks.benchmarks import BENCH_CACHES, compare, run_api_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a dataset and reports query counts, p50/p95 latency and allocation peaks for every API '
+        'endpoint. With --baseline, exits with an error when an endpoint regressed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--tasks', type=int, default=100, help='Root tasks per user.')
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--tags-per-task', type=int, default=2)
+        parser.add_argument('--depth', type=int, default=2, help='Subtask levels under every root task.')
+        parser.add_argument('--fanout', type=int, default=2, help='Subtasks per task and level.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', help='JSON report to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown, as a fraction.')
+        parser.add_argument('--save', help='Write the report to this path.')
+
+    def handle(self, *args, **options):
+        # A private cache and test host keep the run from touching the shared cache or ALLOWED_HOSTS.
+        with override_settings(CACHES=BENCH_CACHES, ALLOWED_HOSTS=['testserver']), transaction.atomic():
+            report = run_api_benchmark(
+                users=options['users'], tasks_per_user=options['tasks'], tags=options['tags'],
+                tags_per_task=options['tags_per_task'],
+                subtask_depth=options['depth'], fanout=options['fanout'], repeat=options['repeat'],
+                seed=options['seed'],
+            )
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(report, indent=2))
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(report, file, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                regressions = compare(report, json.load(file), options['threshold'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
@@ -0,0 +1,27 @@
+import json
+from django.core.management.base import BaseCommand
+from tasks.benchmarks import committed_dataset, run_concurrency_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a dataset and compares the throughput of the async task endpoints under ASGI with the sync '
+        'ones under WSGI for concurrent clients. The data is committed while the run lasts and removed after.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100, help='Root tasks of the benchmark user.')
+        parser.add_argument('--depth', type=int, default=1, help='Subtask levels under every root task.')
+        parser.add_argument('--fanout', type=int, default=2, help='Subtasks per task and level.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and server.')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='bench-asgi')
+
+    def handle(self, *args, **options):
+        with committed_dataset(
+            options['prefix'], users=1, tasks_per_user=options['tasks'], tags=10, subtask_depth=options['depth'],
+            fanout=options['fanout'], seed=options['seed'],
+        ) as (user,):
+            report = run_concurrency_benchmark(user, options['requests'], options['concurrency'])
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,40 @@
+import json
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from tasks.benchmarks import committed_dataset, run_login_flood_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a dataset and measures the task list latency before and during a flood of failed logins, '
+        'with the signup/login throttling on and, with --compare, off. The data is committed while the run '
+        'lasts and removed after.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100, help='Root tasks of the benchmark user.')
+        parser.add_argument('--requests', type=int, default=200, help='Task list requests per phase.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Task list clients.')
+        parser.add_argument('--flood-threads', type=int, default=8)
+        parser.add_argument('--flood-ips', type=int, default=4, help='Client addresses the flood comes from.')
+        parser.add_argument('--flood-rate', type=int, default=20, help='Login attempts per second and thread.')
+        parser.add_argument('--warmup', type=float, default=3.0, help='Seconds of flood before measuring.')
+        parser.add_argument('--compare', action='store_true', help='Also run the flood without throttling.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='bench-flood')
+
+    def handle(self, *args, **options):
+        flood = {
+            name: options[name]
+            for name in ('requests', 'concurrency', 'flood_threads', 'flood_ips', 'flood_rate', 'warmup')
+        }
+        with committed_dataset(
+            options['prefix'], users=1, tasks_per_user=options['tasks'], tags=10, seed=options['seed']
+        ) as (user,):
+            user.set_password('bench-password')
+            user.save()
+            report = { 'throttled': run_login_flood_benchmark(user, **flood) }
+            if options['compare']:
+                with override_settings(AUTH_THROTTLE_ENABLED=False):
+                    report['unthrottled'] = run_login_flood_benchmark(user, **flood)
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,28 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tasks.benchmarks import run_renderer_benchmark, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares encode/decode time and payload size of the JSON, orjson and MessagePack renderers on a '
+        'seeded task list page with nested subtasks and tags.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='Root tasks in the page.')
+        parser.add_argument('--depth', type=int, default=3, help='Subtask levels under every root task.')
+        parser.add_argument('--fanout', type=int, default=3, help='Subtasks per task and level.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user, = seed_dataset(
+                users=1, tasks_per_user=options['page_size'], subtask_depth=options['depth'],
+                fanout=options['fanout'], seed=options['seed'],
+            )
+            report = run_renderer_benchmark(user, options['page_size'], options['repeat'])
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import QueryDict
+from tasks.benchmarks import seed_dataset, summary, timed
+from tasks.filters import filter_tasks
+
+
+FILTER_COMBINATIONS = [
+    '',
+    'state=pending',
+    'expiration_date=2024-06-15',
+    'tags=bench-tag-1',
+    'state=pending&expiration_date=2024-06-15',
+    'state=doing&tags=bench-tag-1',
+    'tags=bench-tag-1&tags=bench-tag-2',
+    'state=complete&expiration_date=2024-06-15&tags=bench-tag-1',
+]
+
+
+class Command(BaseCommand):
+    help = 'Seeds a large dataset and prints EXPLAIN output and timings for every TaskViewSet filter combination.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--tasks', type=int, default=20000, help='Tasks per user.')
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = seed_dataset(
+                users=options['users'], tasks_per_user=options['tasks'], tags=options['tags'], seed=options['seed']
+            )
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            user = users[0]
+            for query_string in FILTER_COMBINATIONS:
+                queryset = filter_tasks(user, QueryDict(query_string)).order_by('id')
+                self.stdout.write(self.style.MIGRATE_HEADING(f'?{query_string}'))
+                self.stdout.write(queryset[:10].explain())
+                page_timings = timed(lambda: list(queryset[:10]), options['repeat'])
+                count_timings = timed(queryset.count, options['repeat'])
+                self.stdout.write(f'page: {summary(page_timings)}  count: {summary(count_timings)}\n')
+            transaction.set_rollback(True)
@@ -0,0 +1,45 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from tasks.benchmarks import seed_dataset, summary, timed
+from tasks.fastpath import TASK_VALUES, serialize_task_rows
+from tasks.models import Task
+from tasks.serializers import TaskSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares TaskSerializer with the .values() fast path on a seeded task list page.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        with transaction.atomic():
+            user, = seed_dataset(users=1, tasks_per_user=options['tasks'], seed=options['seed'])
+            queryset = Task.objects.filter(user=user).order_by('id')
+            page_size = options['page_size']
+
+            def serializer_path():
+                page = queryset.prefetch_related('tags')[:page_size]
+                return renderer.render(TaskSerializer(page, many=True, context={}).data)
+
+            def fast_path():
+                return renderer.render(serialize_task_rows(queryset.values(*TASK_VALUES)[:page_size], {}))
+
+            identical = serializer_path() == fast_path()
+            serializer_timings = timed(serializer_path, options['repeat'])
+            fast_timings = timed(fast_path, options['repeat'])
+            transaction.set_rollback(True)
+        report = {
+            'page_size': page_size,
+            'identical': identical,
+            'serializer': summary(serializer_timings),
+            'fast_path': summary(fast_timings),
+            'speedup': round(summary(serializer_timings)['p50_ms'] / summary(fast_timings)['p50_ms'], 2),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
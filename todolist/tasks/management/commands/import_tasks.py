@@ -0,0 +1,39 @@
+import json
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from tasks.importer import READERS, read_rows, run_import
+from tasks.models import TaskImport
+
+
+class Command(BaseCommand):
+    help = 'Imports tasks for a user from an NDJSON or CSV file in transactional, resumable batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Username that will own the tasks.')
+        parser.add_argument('--format', choices=list(READERS), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=settings.TASKS_IMPORT_BATCH_SIZE)
+        parser.add_argument('--max-rows', type=int, help='Stop at a checkpoint after this many rows.')
+        parser.add_argument('--resume', type=int, help='Id of an unfinished import to continue.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+        if options['resume']:
+            try:
+                task_import = TaskImport.objects.get(id=options['resume'], user=user, completed=False)
+            except TaskImport.DoesNotExist:
+                raise CommandError(f'There is no unfinished import {options["resume"]} for this user.')
+        else:
+            task_import = TaskImport.objects.create(user=user)
+        input_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        with open(options['path'], 'rb') as file:
+            report = run_import(
+                task_import, read_rows(file, input_format), options['batch_size'], options['max_rows']
+            )
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        if 'error' in report:
+            raise CommandError(f'{report["error"]} Resume with --resume {task_import.id} once the file is fixed.')
@@ -0,0 +1,31 @@
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from tasks.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the tombstones of tasks deleted more than --days ago, in transactional batches of --batch-size. '
+        'Sync clients with an older cursor are told to sync from scratch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TASKS_TOMBSTONE_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.TASKS_TOMBSTONE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batches = tombstones = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            pruned = prune_tombstones(cutoff, options['batch_size'])
+            if not pruned:
+                break
+            batches += 1
+            tombstones += pruned
+            if options['verbosity'] > 1:
+                self.stderr.write(f'Batch {batches}: {pruned} tombstones')
+        self.stdout.write(json.dumps({ 'batches': batches, 'tombstones': tombstones }, indent=2))
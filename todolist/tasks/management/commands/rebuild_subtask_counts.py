@@ -0,0 +1,28 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from tasks.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the subtask counters of every task in batches and fixes the ones that drifted. '
+        'With --check, only reports the drift and exits with an error if there is any.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--check', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        checked, drifted = rebuild_counters(batch_size=options['batch_size'], fix=not options['check'])
+        self.stdout.write(json.dumps({
+            'checked': checked,
+            'drifted': len(drifted),
+            'fixed': 0 if options['check'] else len(drifted),
+            'sample': [
+                { 'id': task_id, 'stored': stored, 'expected': expected }
+                for task_id, stored, expected in drifted[:20]
+            ],
+        }, indent=2))
+        if options['check'] and drifted:
+            raise CommandError(f'{len(drifted)} tasks have drifted subtask counters.')
@@ -0,0 +1,29 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from tasks.usage import rebuild_usage
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the per-user tag usage counts from the task tag links and fixes the ones that drifted. '
+        'With --check, only reports the drift and exits with an error if there is any.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            checked, drifted = rebuild_usage(fix=not options['check'])
+        self.stdout.write(json.dumps({
+            'checked': checked,
+            'drifted': len(drifted),
+            'fixed': 0 if options['check'] else len(drifted),
+            'sample': [
+                { 'user': user_id, 'tag': tag_id, 'stored': stored, 'expected': expected }
+                for user_id, tag_id, stored, expected in drifted[:20]
+            ],
+        }, indent=2))
+        if options['check'] and drifted:
+            raise CommandError(f'{len(drifted)} tag usage counts have drifted.')
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0005_task_user_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'state', 'id'], name='task_user_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'expiration_date', 'id'], name='task_user_expiration_idx'),
+        ),
+        # The tag filter joins the auto-created M2M table from the tag side.
+        migrations.RunSQL(
+            'CREATE INDEX task_tags_tag_task_idx ON tasks_task_tags (tag_id, task_id);',
+            reverse_sql='DROP INDEX task_tags_tag_task_idx;',
+        ),
+    ]
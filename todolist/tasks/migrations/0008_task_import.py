@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0007_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rows_done', models.PositiveIntegerField(default=0, verbose_name='Filas procesadas')),
+                ('completed', models.BooleanField(default=False, verbose_name='Completada')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TaskImportKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=100, null=True)),
+                ('parent_external_id', models.CharField(max_length=100, null=True)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tasks.task')),
+                ('task_import', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keys', to='tasks.taskimport')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task_import', 'parent_external_id'], name='task_import_key_parent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('task_import', 'external_id'), name='task_import_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+
+
+def fill_paths(apps, schema_editor):
+    # Level by level from the roots; tasks caught in a parent cycle are not reachable and keep ''.
+    Task = apps.get_model('tasks', 'Task')
+    parent_path = Concat(
+        Subquery(Task.objects.filter(pk=OuterRef('parent_task_id')).values('path')[:1]),
+        Cast('parent_task_id', CharField()),
+        Value('/'),
+        output_field=CharField(),
+    )
+    level = list(Task.objects.filter(parent_task__isnull=True).values_list('id', flat=True))
+    while level:
+        next_level = []
+        for start in range(0, len(level), 1000):
+            children = Task.objects.filter(parent_task_id__in=level[start:start + 1000])
+            children.update(path=parent_path)
+            next_level.extend(children.values_list('id', flat=True))
+        level = next_level
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0009_tag_ordering'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000, verbose_name='Ruta'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['path'], name='task_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:38
+
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counts(apps, schema_editor):
+    # Direct subtasks; with TASKS_SUBTASK_ROLLUP on, run rebuild_subtask_counts afterwards.
+    Task = apps.get_model('tasks', 'Task')
+
+    def subtasks(**filters):
+        count = Task.objects.filter(parent_task=OuterRef('pk'), **filters).order_by().annotate(
+            total=Func(F('id'), function='COUNT')
+        )
+        return Coalesce(Subquery(count.values('total')[:1]), 0)
+
+    Task.objects.update(subtask_count=subtasks(), completed_subtask_count=subtasks(state='complete'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0010_task_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='completed_subtask_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Subtareas completadas'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Subtareas'),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
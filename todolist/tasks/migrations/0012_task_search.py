@@ -0,0 +1,92 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:42
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The title weighs more than the description in the ranking (see tasks.search).
+POSTGRESQL_SEARCH = [
+    """
+    CREATE FUNCTION tasks_task_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('spanish', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('spanish', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tasks_task_search_vector BEFORE INSERT OR UPDATE OF title, description ON tasks_task
+    FOR EACH ROW EXECUTE FUNCTION tasks_task_search_vector()
+    """,
+    # Fires the trigger on every existing row.
+    'UPDATE tasks_task SET title = title',
+    'CREATE INDEX task_search_idx ON tasks_task USING gin (search_vector)',
+]
+POSTGRESQL_SEARCH_REVERSE = [
+    'DROP INDEX task_search_idx',
+    'DROP TRIGGER tasks_task_search_vector ON tasks_task',
+    'DROP FUNCTION tasks_task_search_vector()',
+]
+
+# External content FTS5 table: it only stores the index and reads the text from tasks_task.
+SQLITE_SEARCH = [
+    """
+    CREATE VIRTUAL TABLE tasks_task_fts USING fts5(
+        title, description, content='tasks_task', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER tasks_task_fts_insert AFTER INSERT ON tasks_task BEGIN
+        INSERT INTO tasks_task_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER tasks_task_fts_delete AFTER DELETE ON tasks_task BEGIN
+        INSERT INTO tasks_task_fts(tasks_task_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER tasks_task_fts_update AFTER UPDATE OF title, description ON tasks_task BEGIN
+        INSERT INTO tasks_task_fts(tasks_task_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_task_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO tasks_task_fts(tasks_task_fts) VALUES ('rebuild')",
+]
+SQLITE_SEARCH_REVERSE = [
+    'DROP TRIGGER tasks_task_fts_update',
+    'DROP TRIGGER tasks_task_fts_delete',
+    'DROP TRIGGER tasks_task_fts_insert',
+    'DROP TABLE tasks_task_fts',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0011_subtask_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Kept up to date by triggers, so writes that bypass the model (bulk_create, update()) are indexed.
+        # Other backends get no index and tasks.search falls back to icontains.
+        migrations.RunPython(
+            run({ 'postgresql': POSTGRESQL_SEARCH, 'sqlite': SQLITE_SEARCH }),
+            run({ 'postgresql': POSTGRESQL_SEARCH_REVERSE, 'sqlite': SQLITE_SEARCH_REVERSE }),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0012_task_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200, verbose_name='Título')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Descripción')),
+                ('expiration_date', models.DateField(blank=True, null=True, verbose_name='Fecha de vencimiento')),
+                ('state', models.CharField(choices=[('pending', 'Pendiente'), ('doing', 'En proceso'), ('complete', 'Completada')], default='complete', max_length=20)),
+                ('parent_task', models.BigIntegerField(blank=True, null=True, verbose_name='Tarea padre')),
+                ('path', models.CharField(blank=True, default='', max_length=1000, verbose_name='Ruta')),
+                ('updated_at', models.DateTimeField(verbose_name='Fecha de modificación')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de archivado')),
+                ('tags', models.ManyToManyField(blank=True, related_name='archived_tasks', to='tasks.tag')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_tasks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='task_archive_user_id_idx'), models.Index(fields=['path'], name='task_archive_path_idx', opclasses=['varchar_pattern_ops'])],
+            },
+        ),
+    ]
@@ -0,0 +1,186 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:07
+
+import django.db.models.deletion
+from importlib import import_module
+from django.conf import settings
+from django.db import migrations, models
+
+search = import_module('tasks.migrations.0012_task_search')
+
+# Every insert, update and delete of a task takes the next value of the owner's sequence in tasks_synccursor.
+# The upsert keeps the counter row locked until the writing transaction commits, so the values of a user
+# become visible in order (see tasks.sync). Tag links count as changes of their task.
+POSTGRESQL_SYNC = [
+    """
+    CREATE FUNCTION tasks_next_change_seq(owner bigint) RETURNS bigint AS $$
+        INSERT INTO tasks_synccursor AS cursor (user_id, seq, pruned_seq) VALUES (owner, 1, 0)
+        ON CONFLICT (user_id) DO UPDATE SET seq = cursor.seq + 1
+        RETURNING seq
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE FUNCTION tasks_task_change_seq() RETURNS trigger AS $$
+    BEGIN
+        NEW.change_seq := tasks_next_change_seq(NEW.user_id);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tasks_task_change_seq BEFORE INSERT OR UPDATE ON tasks_task
+    FOR EACH ROW EXECUTE FUNCTION tasks_task_change_seq()
+    """,
+    """
+    CREATE FUNCTION tasks_task_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO tasks_tasktombstone (task, user_id, seq, deleted_at)
+        VALUES (OLD.id, OLD.user_id, tasks_next_change_seq(OLD.user_id), now());
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tasks_task_tombstone AFTER DELETE ON tasks_task
+    FOR EACH ROW EXECUTE FUNCTION tasks_task_tombstone()
+    """,
+    """
+    CREATE FUNCTION tasks_task_tags_change_seq() RETURNS trigger AS $$
+    BEGIN
+        UPDATE tasks_task SET change_seq = 0
+        WHERE id = CASE WHEN TG_OP = 'DELETE' THEN OLD.task_id ELSE NEW.task_id END;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tasks_task_tags_change_seq AFTER INSERT OR DELETE ON tasks_task_tags
+    FOR EACH ROW EXECUTE FUNCTION tasks_task_tags_change_seq()
+    """,
+    # Fires the trigger on every existing row.
+    'UPDATE tasks_task SET change_seq = 0',
+]
+POSTGRESQL_SYNC_REVERSE = [
+    'DROP TRIGGER tasks_task_tags_change_seq ON tasks_task_tags',
+    'DROP FUNCTION tasks_task_tags_change_seq()',
+    'DROP TRIGGER tasks_task_tombstone ON tasks_task',
+    'DROP FUNCTION tasks_task_tombstone()',
+    'DROP TRIGGER tasks_task_change_seq ON tasks_task',
+    'DROP FUNCTION tasks_task_change_seq()',
+    'DROP FUNCTION tasks_next_change_seq(bigint)',
+]
+
+# SQLite writes are serialized anyway. Its triggers cannot assign NEW, so they update the row afterwards;
+# with recursive triggers off that update does not fire them again.
+SQLITE_NEXT_CHANGE_SEQ = """
+    INSERT INTO tasks_synccursor (user_id, seq, pruned_seq) VALUES ({owner}, 1, 0)
+    ON CONFLICT (user_id) DO UPDATE SET seq = seq + 1;
+"""
+SQLITE_SET_CHANGE_SEQ = """
+    UPDATE tasks_task SET change_seq = (SELECT seq FROM tasks_synccursor WHERE user_id = new.user_id)
+    WHERE id = new.id;
+"""
+# Adding change_seq remakes tasks_task on SQLite, which drops the full-text search triggers. Removing it
+# only remakes the table on SQLite versions without DROP COLUMN.
+SQLITE_SEARCH_TRIGGERS = [
+    statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS') for statement in search.SQLITE_SEARCH[1:4]
+]
+SQLITE_SYNC = [
+    *SQLITE_SEARCH_TRIGGERS,
+    f"""
+    CREATE TRIGGER tasks_task_change_seq_insert AFTER INSERT ON tasks_task BEGIN
+        {SQLITE_NEXT_CHANGE_SEQ.format(owner='new.user_id')}
+        {SQLITE_SET_CHANGE_SEQ}
+    END
+    """,
+    f"""
+    CREATE TRIGGER tasks_task_change_seq_update AFTER UPDATE ON tasks_task BEGIN
+        {SQLITE_NEXT_CHANGE_SEQ.format(owner='new.user_id')}
+        {SQLITE_SET_CHANGE_SEQ}
+    END
+    """,
+    f"""
+    CREATE TRIGGER tasks_task_tombstone AFTER DELETE ON tasks_task BEGIN
+        {SQLITE_NEXT_CHANGE_SEQ.format(owner='old.user_id')}
+        INSERT INTO tasks_tasktombstone (task, user_id, seq, deleted_at)
+        SELECT old.id, old.user_id, seq, strftime('%Y-%m-%d %H:%M:%f', 'now')
+        FROM tasks_synccursor WHERE user_id = old.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER tasks_task_tags_change_seq_insert AFTER INSERT ON tasks_task_tags BEGIN
+        UPDATE tasks_task SET change_seq = 0 WHERE id = new.task_id;
+    END
+    """,
+    """
+    CREATE TRIGGER tasks_task_tags_change_seq_delete AFTER DELETE ON tasks_task_tags BEGIN
+        UPDATE tasks_task SET change_seq = 0 WHERE id = old.task_id;
+    END
+    """,
+    'UPDATE tasks_task SET change_seq = 0',
+]
+SQLITE_SYNC_REVERSE = [
+    'DROP TRIGGER tasks_task_tags_change_seq_delete',
+    'DROP TRIGGER tasks_task_tags_change_seq_insert',
+    'DROP TRIGGER tasks_task_tombstone',
+    'DROP TRIGGER tasks_task_change_seq_update',
+    'DROP TRIGGER tasks_task_change_seq_insert',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tasks', '0013_task_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Puts the search triggers back after the table remake that removes change_seq again.
+        migrations.RunPython(
+            migrations.RunPython.noop, search.run({ 'sqlite': SQLITE_SEARCH_TRIGGERS }),
+        ),
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sync_cursor', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('seq', models.BigIntegerField(default=0, verbose_name='Secuencia')),
+                ('pruned_seq', models.BigIntegerField(default=0, verbose_name='Secuencia podada')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TaskTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.BigIntegerField(verbose_name='Tarea')),
+                ('seq', models.BigIntegerField(verbose_name='Secuencia')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de borrado')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Secuencia de cambios'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'change_seq'], name='task_user_change_idx'),
+        ),
+        migrations.AddField(
+            model_name='tasktombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tasktombstone',
+            index=models.Index(fields=['user', 'seq'], name='task_tombstone_user_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tasktombstone',
+            index=models.Index(fields=['deleted_at'], name='task_tombstone_deleted_idx'),
+        ),
+        migrations.RunPython(
+            search.run({ 'postgresql': POSTGRESQL_SYNC, 'sqlite': SQLITE_SYNC }),
+            search.run({ 'postgresql': POSTGRESQL_SYNC_REVERSE, 'sqlite': SQLITE_SYNC_REVERSE }),
+        ),
+    ]
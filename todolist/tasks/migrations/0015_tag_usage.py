@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:12
+
+import django.db.models.deletion
+from importlib import import_module
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+search = import_module('tasks.migrations.0012_task_search')
+
+# name__istartswith compares UPPER(name) LIKE 'PREFIX%' on PostgreSQL, which only a pattern_ops index on the
+# same expression serves. SQLite needs a NOCASE index for its case insensitive LIKE.
+PREFIX_INDEX = {
+    'postgresql': ['CREATE INDEX tag_name_prefix_idx ON tasks_tag (UPPER(name) text_pattern_ops)'],
+    'sqlite': ['CREATE INDEX tag_name_prefix_idx ON tasks_tag (name COLLATE NOCASE)'],
+}
+PREFIX_INDEX_REVERSE = {
+    'postgresql': ['DROP INDEX tag_name_prefix_idx'],
+    'sqlite': ['DROP INDEX tag_name_prefix_idx'],
+}
+
+
+def count_usage(apps, schema_editor):
+    TagUsage = apps.get_model('tasks', 'TagUsage')
+    TaskTag = apps.get_model('tasks', 'Task').tags.through
+    TagUsage.objects.bulk_create((
+        TagUsage(user_id=user_id, tag_id=tag_id, count=count)
+        for user_id, tag_id, count in TaskTag.objects.order_by().values('task__user_id', 'tag_id').annotate(
+            count=Count('id')
+        ).values_list('task__user_id', 'tag_id', 'count').iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0014_task_sync'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Tareas')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='tasks.tag')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-count'], name='tag_usage_user_count_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'tag'), name='tag_usage_unique')],
+            },
+        ),
+        migrations.RunPython(search.run(PREFIX_INDEX), search.run(PREFIX_INDEX_REVERSE)),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+    ]
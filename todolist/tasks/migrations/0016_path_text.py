@@ -0,0 +1,61 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:20
+
+from importlib import import_module
+from django.conf import settings
+from django.db import migrations, models
+
+sync = import_module('tasks.migrations.0014_task_sync')
+
+# Changing the type of path remakes tasks_task on SQLite in both directions. The remake fails while the
+# triggers of tasks_task_tags point at the table, and drops the search and change sequence triggers of the
+# table itself, so they are all dropped before and created again after.
+SQLITE_TRIGGERS = sync.SQLITE_SEARCH_TRIGGERS + [
+    statement for statement in sync.SQLITE_SYNC[len(sync.SQLITE_SEARCH_TRIGGERS):] if 'CREATE TRIGGER' in statement
+]
+SQLITE_TRIGGERS_REVERSE = [
+    statement.replace('DROP TRIGGER', 'DROP TRIGGER IF EXISTS')
+    for statement in sync.SQLITE_SYNC_REVERSE + sync.search.SQLITE_SEARCH_REVERSE
+    if statement.startswith('DROP TRIGGER')
+]
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0015_tag_usage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            sync.search.run({ 'sqlite': SQLITE_TRIGGERS_REVERSE }), sync.search.run({ 'sqlite': SQLITE_TRIGGERS }),
+        ),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_path_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='taskarchive',
+            name='task_archive_path_idx',
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='path',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Ruta'),
+        ),
+        migrations.AlterField(
+            model_name='taskarchive',
+            name='path',
+            field=models.TextField(blank=True, default='', verbose_name='Ruta'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['path'], name='task_path_idx', opclasses=['text_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='taskarchive',
+            index=models.Index(fields=['path'], name='task_archive_path_idx', opclasses=['text_pattern_ops']),
+        ),
+        migrations.RunPython(
+            sync.search.run({ 'sqlite': SQLITE_TRIGGERS }), sync.search.run({ 'sqlite': SQLITE_TRIGGERS_REVERSE }),
+        ),
+    ]
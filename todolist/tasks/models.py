@@ -1,8 +1,14 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 
 class Tag(models.Model):
+    # ?prefix= lookups use the tag_name_prefix_idx expression index created by migration 0015.
     name = models.CharField(max_length=50, verbose_name='Nombre', unique=True)
+    updated_at = models.DateTimeField(verbose_name='Fecha de modificación', auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ['name']
 
     def __str__(self):
         return self.name
@@ -24,6 +30,142 @@ class Task(models.Model):
         'self', verbose_name='Tarea padre', null=True, blank=True, related_name='subtasks', on_delete=models.CASCADE
     )
     tags = models.ManyToManyField(Tag, blank=True, related_name='tasks')
+    updated_at = models.DateTimeField(verbose_name='Fecha de modificación', auto_now=True)
+    # Ids of the ancestors, root first, each followed by '/'. Maintained by tasks.tree.
+    path = models.TextField(verbose_name='Ruta', blank=True, default='', editable=False)
+    # Direct subtasks, or every descendant with TASKS_SUBTASK_ROLLUP. Maintained by tasks.counters.
+    subtask_count = models.PositiveIntegerField(verbose_name='Subtareas', default=0, editable=False)
+    completed_subtask_count = models.PositiveIntegerField(
+        verbose_name='Subtareas completadas', default=0, editable=False
+    )
+    # Weighted title and description, filled by a database trigger on PostgreSQL. See tasks.search.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Value of the owner's change sequence taken by the last write, set by database triggers. See tasks.sync.
+    change_seq = models.BigIntegerField(verbose_name='Secuencia de cambios', default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='task_user_id_idx'),
+            models.Index(fields=['user', 'state', 'id'], name='task_user_state_idx'),
+            models.Index(fields=['user', 'expiration_date', 'id'], name='task_user_expiration_idx'),
+            models.Index(fields=['user', 'updated_at'], name='task_user_updated_idx'),
+            models.Index(fields=['path'], name='task_path_idx', opclasses=['text_pattern_ops']),
+            models.Index(fields=['user', 'change_seq'], name='task_user_change_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    # Written with UPDATEs of their own, so a plain save never writes back a stale copy.
+    MAINTAINED_FIELDS = ('path', 'subtask_count', 'completed_subtask_count', 'search_vector', 'change_seq')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so reparents and state changes can be told apart from any other save.
+        instance._loaded_parent_id = instance.__dict__.get('parent_task_id')
+        instance._loaded_state = instance.__dict__.get('state')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        # The path and counter updates run from the save signals, inside the same transaction.
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
+    @property
+    def subtree_path(self):
+        """Prefix of the path of every descendant."""
+        return f'{self.path}{self.pk}/'
+
+
+class TaskImport(models.Model):
+    user = models.ForeignKey(User, related_name='task_imports', on_delete=models.CASCADE)
+    rows_done = models.PositiveIntegerField(verbose_name='Filas procesadas', default=0)
+    completed = models.BooleanField(verbose_name='Completada', default=False)
+    created_at = models.DateTimeField(verbose_name='Fecha de creación', auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name='Fecha de modificación', auto_now=True)
+
+
+class TaskImportKey(models.Model):
+    """Maps the ids used in an import file to the created tasks until their parent links are resolved."""
+    task_import = models.ForeignKey(TaskImport, related_name='keys', on_delete=models.CASCADE)
+    external_id = models.CharField(max_length=100, null=True)
+    parent_external_id = models.CharField(max_length=100, null=True)
+    task = models.ForeignKey(Task, related_name='+', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task_import', 'external_id'], name='task_import_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['task_import', 'parent_external_id'], name='task_import_key_parent_idx'),
+        ]
+
+
+class TaskArchive(models.Model):
+    """
+    Completed task moved out of the Task table by the archive_tasks command. It keeps its id, parent id
+    and path, so a whole subtree can be restored as it was.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200, verbose_name='Título')
+    description = models.TextField(verbose_name='Descripción', blank=True, null=True)
+    expiration_date = models.DateField(verbose_name='Fecha de vencimiento', blank=True, null=True)
+    state = models.CharField(choices=STATE_CHOICES, max_length=20, default='complete')
+    user = models.ForeignKey(User, related_name='archived_tasks', on_delete=models.PROTECT)
+    parent_task = models.BigIntegerField(verbose_name='Tarea padre', null=True, blank=True)
+    tags = models.ManyToManyField(Tag, blank=True, related_name='archived_tasks')
+    path = models.TextField(verbose_name='Ruta', blank=True, default='')
+    updated_at = models.DateTimeField(verbose_name='Fecha de modificación')
+    archived_at = models.DateTimeField(verbose_name='Fecha de archivado', auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='task_archive_user_id_idx'),
+            models.Index(fields=['path'], name='task_archive_path_idx', opclasses=['text_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class TagUsage(models.Model):
+    """How many tasks of a user carry a tag. Maintained by tasks.usage."""
+    user = models.ForeignKey(User, related_name='tag_usage', on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, related_name='usage', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(verbose_name='Tareas', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'tag'], name='tag_usage_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-count'], name='tag_usage_user_count_idx'),
+        ]
+
+
+class SyncCursor(models.Model):
+    """Last value handed out by the change sequence of a user's tasks. Written by database triggers."""
+    user = models.OneToOneField(User, primary_key=True, related_name='sync_cursor', on_delete=models.CASCADE)
+    seq = models.BigIntegerField(verbose_name='Secuencia', default=0)
+    # Tombstones up to this value were pruned, so older client cursors can no longer be served.
+    pruned_seq = models.BigIntegerField(verbose_name='Secuencia podada', default=0)
+
+
+class TaskTombstone(models.Model):
+    """Deleted task, written by a database trigger so sync clients learn about every delete."""
+    task = models.BigIntegerField(verbose_name='Tarea')
+    user = models.ForeignKey(User, related_name='task_tombstones', on_delete=models.CASCADE)
+    seq = models.BigIntegerField(verbose_name='Secuencia')
+    deleted_at = models.DateTimeField(verbose_name='Fecha de borrado', auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'seq'], name='task_tombstone_user_seq_idx'),
+            models.Index(fields=['deleted_at'], name='task_tombstone_deleted_idx'),
+        ]
@@ -2,4 +2,9 @@ from rest_framework.permissions import BasePermission
 
 class IsOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
+        # Comparing the raw foreign key spares loading the owner.
+        return obj.user_id == request.user.pk
+
+    async def ahas_object_permission(self, request, view, row):
+        # Async views work on `.values()` rows, so the raw foreign key is compared without a query.
+        return row['user'] == request.user.pk
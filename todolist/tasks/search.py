@@ -0,0 +1,48 @@
+"""
+Full-text search over the title and description of tasks.
+
+On PostgreSQL a trigger keeps the weighted `Task.search_vector` up to date and a GIN index serves the
+matches; on SQLite an FTS5 table is kept in sync by triggers. Both come from migration 0012, so rows
+written by bulk_create(), update() or raw SQL are indexed too. Other backends fall back to an
+unindexed icontains match.
+"""
+
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from .models import Task
+
+# Text search configuration of the PostgreSQL trigger in migration 0012.
+SEARCH_CONFIG = 'spanish'
+FTS_TABLE = 'tasks_task_fts'
+
+
+def fts_query(text):
+    # Every term is quoted, so user input never reaches the FTS5 query syntax.
+    return ' '.join(f'"{term}"' for term in re.findall(r'\w+', text))
+
+
+def search_tasks(queryset, text):
+    """Tasks of `queryset` matching every term of `text`, annotated with a `rank` (higher is better)."""
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query))
+    if vendor == 'sqlite':
+        match = fts_query(text)
+        if not match:
+            return queryset.annotate(rank=Value(0.0, output_field=FloatField())).none()
+        table = Task._meta.db_table
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        ).annotate(rank=RawSQL(
+            # bm25() is lower for better matches; the title weighs twice the description.
+            f'SELECT -bm25({FTS_TABLE}, 2.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            [match], output_field=FloatField(),
+        ))
+    return queryset.filter(Q(title__icontains=text) | Q(description__icontains=text)).annotate(
+        rank=Value(1.0, output_field=FloatField())
+    )
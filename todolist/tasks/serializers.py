@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
+from django.db import models
 from rest_framework import serializers
-from .models import Tag, Task
+from .models import STATE_CHOICES, Tag, TagUsage, Task, TaskArchive
+from .tree import CYCLE_ERROR, creates_cycle, load_subtasks
 from datetime import datetime
 
 
@@ -23,8 +25,51 @@ class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['name']
+
+
+class TagUsageSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(source='tag.name')
+
+    class Meta:
+        model = TagUsage
+        fields = ['name', 'count']
     
 
+def parse_fieldset(query_params):
+    """Read the ?fields=, ?exclude= and ?depth= parameters of a task read request."""
+    fields = query_params.get('fields')
+    exclude = query_params.get('exclude', '')
+    depth = query_params.get('depth')
+    if depth is not None and not depth.isdigit():
+        raise serializers.ValidationError({ 'depth': 'La profundidad debe ser un número entero positivo.' })
+    return {
+        'fields': { name.strip() for name in fields.split(',') } if fields is not None else None,
+        'exclude': { name.strip() for name in exclude.split(',') },
+        'depth': int(depth) if depth is not None else None,
+    }
+
+
+def includes_field(context, name):
+    if name == 'subtasks' and context.get('depth') == 0:
+        return False
+    fields = context.get('fields')
+    return (fields is None or name in fields) and name not in context.get('exclude', ())
+
+
+def load_subtasks_for(serializer, tasks):
+    if 'subtasks' in serializer.fields and 'subtasks' not in serializer.context:
+        serializer.context['subtasks'] = load_subtasks(
+            tasks, serializer.context.get('depth'), 'tags' in serializer.fields
+        )
+
+
+class TaskListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        tasks = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        load_subtasks_for(self.child, tasks)
+        return super().to_representation(tasks)
+
+
 class TaskSerializer(serializers.ModelSerializer):
     subtasks = serializers.SerializerMethodField()
     tags = TagSerializer(many=True, required=False)
@@ -32,13 +77,32 @@ class TaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = [
-            'id', 'title', 'description', 'expiration_date', 'state', 'user', 'parent_task', 'subtasks', 'tags'
+            'id', 'title', 'description', 'expiration_date', 'state', 'user', 'parent_task',
+            'subtask_count', 'completed_subtask_count', 'subtasks', 'tags'
         ]
-        read_only_fields = ['user', 'subtasks'] 
+        read_only_fields = ['user', 'subtasks', 'subtask_count', 'completed_subtask_count'] 
+        list_serializer_class = TaskListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in list(self.fields):
+            if not includes_field(self.context, name):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        load_subtasks_for(self, [instance])
+        return super().to_representation(instance)
 
     def get_subtasks(self, obj):
-        subtasks = Task.objects.filter(parent_task=obj)
-        return TaskSerializer(subtasks, many=True).data
+        subtasks = self.context['subtasks'].get(obj.pk, [])
+        depth = self.context.get('depth')
+        context = self.context if depth is None else { **self.context, 'depth': depth - 1 }
+        return TaskSerializer(subtasks, many=True, context=context).data
+
+    def validate(self, attrs):
+        if self.instance is not None and creates_cycle(self.instance, attrs.get('parent_task')):
+            raise serializers.ValidationError({ 'parent_task': CYCLE_ERROR })
+        return attrs
 
     def create(self, validated_data):
         state_choices = [choice[0] for choice in Task._meta.get_field('state').choices]
@@ -64,3 +128,49 @@ class TaskSerializer(serializers.ModelSerializer):
                 tag, created = Tag.objects.get_or_create(name=tag_data['name'])
                 task.tags.add(tag)
         return task
+
+
+class TaskArchiveSerializer(serializers.ModelSerializer):
+    tags = TagSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = TaskArchive
+        fields = [
+            'id', 'title', 'description', 'expiration_date', 'state', 'user', 'parent_task', 'tags', 'archived_at'
+        ]
+
+
+class TagNameSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=50)
+
+
+class BulkTaskSerializer(serializers.ModelSerializer):
+    parent_task = serializers.IntegerField(required=False, allow_null=True)
+    tags = TagNameSerializer(many=True, required=False)
+
+    class Meta:
+        model = Task
+        fields = ['title', 'description', 'expiration_date', 'state', 'parent_task', 'tags']
+
+
+class BulkOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    id = serializers.IntegerField(required=False)
+    data = serializers.DictField(required=False, default=dict)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'create' and 'id' not in attrs:
+            raise serializers.ValidationError({ 'id': 'La operación necesita el id de la tarea.' })
+        return attrs
+
+
+class TaskImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    input = serializers.ChoiceField(choices=['ndjson', 'csv'], required=False)
+    resume = serializers.IntegerField(required=False)
+    max_rows = serializers.IntegerField(required=False, min_value=1)
+
+
+class BulkTransitionSerializer(serializers.Serializer):
+    state = serializers.ChoiceField(choices=STATE_CHOICES)
+    include_subtasks = serializers.BooleanField(required=False, default=False)
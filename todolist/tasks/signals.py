@@ -0,0 +1,95 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import user_cache
+from .cache import TAGS_SCOPE, bump_version
+from .models import Tag, Task
+from .counters import add_delta, apply_deltas, targets, weight
+from .tree import finish_save, prepare_save, subtree
+from .usage import apply_usage, link_counts, tag_links_changed
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_version(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Covers deactivation and password changes, which must not be served from the cache.
+    user_cache.invalidate(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+@receiver(pre_save, sender=Task)
+def task_saving(sender, instance, **kwargs):
+    prepare_save(instance)
+
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance, created, **kwargs):
+    finish_save(instance, created)
+
+
+@receiver(pre_delete, sender=Task)
+def task_deleting(sender, instance, origin=None, **kwargs):
+    # Cascaded tasks were just read by the collector, but the one delete() was called on may be stale.
+    if origin is instance:
+        instance.refresh_from_db(fields=['parent_task', 'path', 'state'])
+        roots = [instance]
+    elif (
+        isinstance(origin, QuerySet) and origin.model is Task
+        and not getattr(origin, 'counters_applied', False) and not getattr(origin, 'usage_applied', False)
+    ):
+        # Every collected task sends this signal, so the whole queryset is counted on the first one.
+        origin.usage_applied = True
+        roots = list(origin.only('id', 'path'))
+    else:
+        return
+    # The collector drops the tag links of the subtrees without m2m_changed. delete_subtrees counts its own.
+    links = Task.tags.through.objects.filter(task__in=Task.objects.filter(subtree(roots)))
+    apply_usage(link_counts(links), sign=-1)
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance, origin=None, **kwargs):
+    if getattr(origin, 'counters_applied', False):
+        return
+    # Every deleted descendant sends its own signal, so each one only takes itself off the counters.
+    deltas = {}
+    add_delta(deltas, targets(instance.parent_task_id, instance.path), *weight(instance.state), sign=-1)
+    apply_deltas(deltas)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_changed(sender, instance, **kwargs):
+    bump_version(instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    bump_version(TAGS_SCOPE)
+
+
+@receiver(m2m_changed, sender=Task.tags.through)
+def task_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    tag_links_changed(instance, action, reverse, pk_set)
+    if not action.startswith('post_'):
+        return
+    # Tag links do not go through Model.save(), so refresh the modification timestamps here.
+    if not reverse:
+        Task.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+        bump_version(instance.user_id)
+    elif pk_set:
+        Task.objects.filter(id__in=pk_set).update(updated_at=timezone.now())
+        for user_id in Task.objects.filter(id__in=pk_set).values_list('user_id', flat=True).distinct():
+            bump_version(user_id)
+    else:
+        Tag.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+        bump_version(TAGS_SCOPE)
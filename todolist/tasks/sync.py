@@ -0,0 +1,65 @@
+"""
+Delta sync for offline clients.
+
+Every insert, update and delete of a task takes the next value of a per-user change sequence, assigned by
+database triggers (migration 0014), so raw updates, bulk writes, tag links, archival and cascaded deletes
+are all covered. Deleted tasks leave a TaskTombstone with the value of the delete. The counter row stays
+locked until the writing transaction commits, so a client that has seen value N has seen every earlier one.
+"""
+
+from django.db import transaction
+from .fastpath import TASK_VALUES, serialize_task_rows
+from .models import SyncCursor, Task, TaskTombstone
+
+
+def is_stale(user, since):
+    """Whether tombstones after `since` were already pruned, so the client has to sync from scratch."""
+    return since > 0 and SyncCursor.objects.filter(user=user, pruned_seq__gt=since).exists()
+
+
+def task_changes(user, since, limit, context):
+    """
+    Up to `limit` changes of the tasks of `user` after the cursor `since`, in sequence order: the current
+    state of the created or updated tasks and the ids of the deleted ones. A deleted id that shows up among
+    the tasks too was restored afterwards, so clients apply the deletes first.
+    """
+    rows = list(
+        Task.objects.filter(user=user, change_seq__gt=since).order_by('change_seq').values(
+            *TASK_VALUES, 'change_seq'
+        )[:limit + 1]
+    )
+    tombstones = list(
+        TaskTombstone.objects.filter(user=user, seq__gt=since).order_by('seq').values_list('seq', 'task')[:limit + 1]
+    )
+    # The first `limit` values of both lists together are the first `limit` changes.
+    changes = sorted([(row['change_seq'], row, None) for row in rows] + [
+        (seq, None, task_id) for seq, task_id in tombstones
+    ], key=lambda change: change[0])
+    more = len(changes) > limit
+    changes = changes[:limit]
+    return {
+        'cursor': changes[-1][0] if changes else since,
+        'more': more,
+        'deleted': [task_id for seq, row, task_id in changes if row is None],
+        'tasks': serialize_task_rows([row for seq, row, task_id in changes if row is not None], context),
+    }
+
+
+def prune_tombstones(cutoff, batch_size=1000):
+    """
+    Delete up to `batch_size` tombstones written before `cutoff` in one transaction, raising the pruned
+    sequence value of their users first. Returns how many were deleted.
+    """
+    with transaction.atomic():
+        tombstones = list(
+            TaskTombstone.objects.filter(deleted_at__lt=cutoff).order_by('id').values_list('id', 'user_id', 'seq')[
+                :batch_size
+            ]
+        )
+        pruned = {}
+        for tombstone_id, user_id, seq in tombstones:
+            pruned[user_id] = max(pruned.get(user_id, 0), seq)
+        for user_id, seq in pruned.items():
+            SyncCursor.objects.filter(user_id=user_id, pruned_seq__lt=seq).update(pruned_seq=seq)
+        TaskTombstone.objects.filter(id__in=[tombstone[0] for tombstone in tombstones]).delete()
+    return len(tombstones)
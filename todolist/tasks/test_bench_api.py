@@ -0,0 +1,40 @@
+from django.test import TestCase, override_settings
+from .benchmarks import compare, run_api_benchmark
+
+QUERY_BUDGET = {
+    'signup': 2,
+    'login': 1,
+    'task_list': 6,
+    'task_filter': 6,
+    'task_detail': 6,
+    'task_create': 14,
+    'tag_list': 2,
+    'tag_create': 2,
+    'tag_detail': 2,
+    'tag_update': 3,
+    'tag_delete': 5,
+}
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class APIBenchmarkTestCase(TestCase):
+    def test_every_endpoint_stays_within_its_query_budget(self):
+        report = run_api_benchmark(tasks_per_user=5, subtask_depth=2, fanout=2, repeat=1)
+        self.assertEqual(set(report), set(QUERY_BUDGET))
+        for endpoint, result in report.items():
+            self.assertLess(result['status'], 300, endpoint)
+            self.assertLessEqual(result['queries'], QUERY_BUDGET[endpoint], endpoint)
+
+    def test_query_counts_do_not_grow_with_data_volume(self):
+        small = run_api_benchmark(tasks_per_user=10, tags=2, subtask_depth=1, fanout=1, repeat=1)
+        large = run_api_benchmark(
+            tasks_per_user=20, tags=2, subtask_depth=3, fanout=3, repeat=1, seed=1, prefix='large'
+        )
+        for endpoint in small:
+            self.assertEqual(small[endpoint]['queries'], large[endpoint]['queries'], endpoint)
+
+    def test_compare_flags_regressions(self):
+        baseline = { 'task_list': { 'queries': 5, 'p95_ms': 10.0, 'peak_kb': 100.0 } }
+        self.assertEqual(compare({ 'task_list': { 'queries': 5, 'p95_ms': 11.0, 'peak_kb': 100.0 } }, baseline), [])
+        regressions = compare({ 'task_list': { 'queries': 6, 'p95_ms': 20.0, 'peak_kb': 100.0 } }, baseline)
+        self.assertEqual(len(regressions), 2)
@@ -1,9 +1,40 @@
+import csv
+import json
+import msgpack
+import os
+import shutil
+import tempfile
+from unittest import mock
+from datetime import timedelta
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import connection, connections
+from django.http import QueryDict
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from .models import Task, Tag
+from django.utils import timezone
+from .models import SyncCursor, Task, TaskArchive, TaskTombstone, Tag, TagUsage
+from .authentication import user_cache
+from .counters import rebuild_counters
+from .fastpath import TASK_VALUES, serialize_task_rows
+from .serializers import TaskSerializer, parse_fieldset
+from .sync import prune_tombstones
+from .throttling import auth_buckets
+from .usage import rebuild_usage
+from todolist.middleware import aggregates
+from todolist.routers import pin_key
 
 class UserAPITest(TestCase):
+    def setUp(self):
+        auth_buckets.clear()
+
     def test_signup(self):
         data = {
             'username': 'user',
@@ -171,7 +202,7 @@ class TagTestCase(TestCase):
         Tag.objects.create(name='Urgente')
         response = self.client.get('/api/tags/', format='json')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual([tag['name'] for tag in response.data['results']], ['Importante', 'Urgente'])
 
     def test_filter_tasks_by_tag(self):
         tag = Tag.objects.create(name='Urgente')
@@ -194,3 +225,1401 @@ class TagTestCase(TestCase):
         self.assertTrue(Tag.objects.filter(name='Urgente').exists())
         self.assertTrue(Tag.objects.filter(name='Importante').exists())
 
+
+class TaskSubtaskTreeTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='Urgente')
+
+    def create_chain(self, root, depth):
+        parent = root
+        for level in range(depth):
+            parent = Task.objects.create(title=f'Subtarea {level}', parent_task=parent, user=self.user)
+            parent.tags.add(self.tag)
+        return parent
+
+    def test_nested_subtasks_output(self):
+        root = Task.objects.create(title='Tarea raíz', user=self.user)
+        leaf = self.create_chain(root, 3)
+        response = self.client.get(f'/api/tasks/{root.id}/', format='json')
+        self.assertEqual(response.status_code, 200)
+        node = response.data
+        for level in range(3):
+            self.assertEqual(len(node['subtasks']), 1)
+            node = node['subtasks'][0]
+            self.assertEqual(node['title'], f'Subtarea {level}')
+            self.assertEqual(node['tags'], [{ 'name': 'Urgente' }])
+        self.assertEqual(node['id'], leaf.id)
+        self.assertEqual(node['subtasks'], [])
+
+    def test_list_query_count_is_independent_of_depth(self):
+        shallow = Task.objects.create(title='Poco profunda', user=self.user)
+        self.create_chain(shallow, 1)
+        # ETag validators, count, page, subtree and the tags of every row.
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/tasks/?page_size=1', format='json')
+        self.assertEqual(response.status_code, 200)
+
+        Task.objects.all().delete()
+        deep = Task.objects.create(title='Profunda', user=self.user)
+        self.create_chain(deep, 10)
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/tasks/?page_size=1', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['title'], 'Profunda')
+
+
+class TaskCursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='Urgente')
+        for i in range(15):
+            task = Task.objects.create(title=f'Tarea {i}', user=self.user, state='pending' if i % 2 else 'doing')
+            task.tags.add(self.tag)
+
+    def test_cursor_pages_without_count(self):
+        response = self.client.get('/api/tasks/?pagination=cursor', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual(len(response.data['results']), 10)
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_cursor_pages_keep_filters(self):
+        query = 'pagination=cursor&state=pending&tags=Urgente&page_size=5'
+        response = self.client.get(f'/api/tasks/?{query}', format='json')
+        self.assertEqual(response.status_code, 200)
+        titles = [task['title'] for task in response.data['results']]
+        response = self.client.get(response.data['next'], format='json')
+        titles += [task['title'] for task in response.data['results']]
+        self.assertEqual(titles, [f'Tarea {i}' for i in range(1, 15, 2)])
+
+    @override_settings(TASKS_PAGINATION_MODE='cursor')
+    def test_cursor_mode_from_settings(self):
+        response = self.client.get('/api/tasks/', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        response = self.client.get('/api/tasks/?pagination=page', format='json')
+        self.assertEqual(response.data['count'], 15)
+
+
+class BenchTaskFiltersCommandTestCase(TestCase):
+    def test_prints_plan_and_timings_for_every_filter(self):
+        out = StringIO()
+        call_command('bench_task_filters', users=1, tasks=50, tags=5, repeat=1, stdout=out)
+        output = out.getvalue()
+        self.assertEqual(output.count('page: '), 8)
+        self.assertFalse(Task.objects.exists())
+
+
+class TaskBulkTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_create_update_delete(self):
+        Tag.objects.create(name='Urgente')
+        to_update = Task.objects.create(title='Vieja', user=self.user)
+        to_delete = Task.objects.create(title='Borrar', user=self.user)
+        operations = [
+            { 'op': 'create', 'data': { 'title': 'Nueva 1', 'tags': [{ 'name': 'Urgente' }, { 'name': 'Nueva' }] } },
+            { 'op': 'create', 'data': { 'title': 'Nueva 2', 'parent_task': to_update.id, 'state': 'doing' } },
+            { 'op': 'update', 'id': to_update.id, 'data': { 'title': 'Actualizada', 'tags': [{ 'name': 'Nueva' }] } },
+            { 'op': 'delete', 'id': to_delete.id },
+        ]
+        response = self.client.post('/api/tasks/bulk/', operations, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']], ['ok'] * 4)
+        created = Task.objects.get(id=response.data['results'][0]['id'])
+        self.assertEqual(set(created.tags.values_list('name', flat=True)), { 'Urgente', 'Nueva' })
+        child = Task.objects.get(id=response.data['results'][1]['id'])
+        self.assertEqual(child.parent_task_id, to_update.id)
+        self.assertEqual(child.state, 'doing')
+        to_update.refresh_from_db()
+        self.assertEqual(to_update.title, 'Actualizada')
+        self.assertEqual(list(to_update.tags.values_list('name', flat=True)), ['Nueva'])
+        self.assertFalse(Task.objects.filter(id=to_delete.id).exists())
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_bulk_reports_item_errors(self):
+        user2 = User.objects.create_user(username='user2', password='password2')
+        other = Task.objects.create(title='Ajena', user=user2)
+        operations = [
+            { 'op': 'create', 'data': { 'title': 'Válida' } },
+            { 'op': 'create', 'data': { 'description': 'Sin título' } },
+            { 'op': 'create', 'data': { 'title': 'Estado erróneo', 'state': 'bad_state' } },
+            { 'op': 'update', 'id': other.id, 'data': { 'title': 'Robada' } },
+            { 'op': 'delete' },
+            { 'op': 'create', 'data': { 'title': 'Hija ajena', 'parent_task': other.id } },
+        ]
+        response = self.client.post('/api/tasks/bulk/', operations, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['ok'] + ['error'] * 5)
+        self.assertIn('title', results[1]['errors'])
+        self.assertIn('state', results[2]['errors'])
+        self.assertIn('id', results[3]['errors'])
+        self.assertIn('id', results[4]['errors'])
+        self.assertIn('parent_task', results[5]['errors'])
+        self.assertEqual(list(Task.objects.filter(user=self.user).values_list('title', flat=True)), ['Válida'])
+        other.refresh_from_db()
+        self.assertEqual(other.title, 'Ajena')
+
+    def test_bulk_create_query_count_is_independent_of_size(self):
+        operations = [
+            { 'op': 'create', 'data': { 'title': f'Tarea {i}', 'tags': [{ 'name': f'tag-{i % 5}' }] } }
+            for i in range(50)
+        ]
+        # Tag lookup, tag upsert, tasks insert, tag links insert and tag usage upsert, inside a savepoint.
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/tasks/bulk/', operations, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.tags.through.objects.count(), 50)
+
+    def test_bulk_requires_list(self):
+        response = self.client.post('/api/tasks/bulk/', { 'op': 'create' }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TaskResponseCacheTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.task = Task.objects.create(title='Tarea', user=self.user)
+
+    @override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=1.0)
+    def test_second_read_is_a_hit(self):
+        aggregates.reset()
+        response = self.client.get('/api/tasks/', format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        # Only the ETag validators hit the database.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/tasks/', format='json')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['title'], 'Tarea')
+        stats = aggregates.snapshot()['GET task-list']
+        self.assertEqual((stats['cache_hits'], stats['cache_misses']), (1, 1))
+        response = self.client.get('/api/tasks/?state=pending', format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_writes_invalidate_cached_responses(self):
+        self.client.get(f'/api/tasks/{self.task.id}/', format='json')
+        self.client.patch(f'/api/tasks/{self.task.id}/', { 'title': 'Cambiada' }, format='json')
+        response = self.client.get(f'/api/tasks/{self.task.id}/', format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['title'], 'Cambiada')
+
+        self.task.tags.add(Tag.objects.create(name='Urgente'))
+        response = self.client.get(f'/api/tasks/{self.task.id}/', format='json')
+        self.assertEqual(response.data['tags'], [{ 'name': 'Urgente' }])
+
+        Tag.objects.filter(name='Urgente').update(name='Importante')
+        Tag.objects.get(name='Importante').save()
+        response = self.client.get(f'/api/tasks/{self.task.id}/', format='json')
+        self.assertEqual(response.data['tags'], [{ 'name': 'Importante' }])
+
+        self.client.post('/api/tasks/bulk/', [{ 'op': 'create', 'data': { 'title': 'Nueva' } }], format='json')
+        response = self.client.get('/api/tasks/', format='json')
+        self.assertEqual(response.data['count'], 2)
+
+    def test_cache_is_per_user(self):
+        self.client.get('/api/tasks/', format='json')
+        user2 = User.objects.create_user(username='user2', password='password2')
+        self.client.force_authenticate(user=user2)
+        response = self.client.get('/api/tasks/', format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'], [])
+
+    @override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=1.0)
+    def test_errors_are_not_cached(self):
+        aggregates.reset()
+        user2 = User.objects.create_user(username='user2', password='password2')
+        other = Task.objects.create(title='Ajena', user=user2)
+        for _ in range(2):
+            response = self.client.get(f'/api/tasks/{other.id}/', format='json')
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(aggregates.snapshot()['GET task-detail']['cache_hits'], 0)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.task = Task.objects.create(title='Tarea', user=self.user)
+
+    def test_task_list_not_modified(self):
+        response = self.client.get('/api/tasks/', format='json')
+        etag = response['ETag']
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/tasks/', format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get('/api/tasks/?state=doing', format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_task_etag_changes_on_writes(self):
+        etags = { self.client.get(f'/api/tasks/{self.task.id}/', format='json')['ETag'] }
+        Task.objects.create(title='Subtarea', parent_task=self.task, user=self.user)
+        etags.add(self.client.get(f'/api/tasks/{self.task.id}/', format='json')['ETag'])
+        self.task.tags.add(Tag.objects.create(name='Urgente'))
+        etags.add(self.client.get(f'/api/tasks/{self.task.id}/', format='json')['ETag'])
+        Tag.objects.get(name='Urgente').tasks.clear()
+        response = self.client.get(f'/api/tasks/{self.task.id}/', format='json')
+        etags.add(response['ETag'])
+        self.assertEqual(len(etags), 4)
+        self.assertEqual(response.data['tags'], [])
+
+    def test_task_detail_of_other_user_is_not_conditional(self):
+        etag = self.client.get(f'/api/tasks/{self.task.id}/', format='json')['ETag']
+        user2 = User.objects.create_user(username='user2', password='password2')
+        self.client.force_authenticate(user=user2)
+        response = self.client.get(f'/api/tasks/{self.task.id}/', format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_tag_list_not_modified(self):
+        Tag.objects.create(name='Urgente')
+        etag = self.client.get('/api/tags/', format='json')['ETag']
+        response = self.client.get('/api/tags/', format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.post('/api/tags/', { 'name': 'Importante' }, format='json')
+        response = self.client.get('/api/tags/', format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_missing_tag_is_not_found(self):
+        tag = Tag.objects.create(name='Urgente')
+        etag = self.client.get(f'/api/tags/{tag.id}/', format='json')['ETag']
+        self.assertEqual(
+            self.client.get(f'/api/tags/{tag.id}/', format='json', HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        for if_none_match in ['*', etag]:
+            response = self.client.get(f'/api/tags/{tag.id + 1}/', format='json', HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual(response.status_code, 404)
+
+
+class TaskExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        tag = Tag.objects.create(name='Urgente')
+        self.parent = Task.objects.create(title='Padre', user=self.user, expiration_date='2024-11-17')
+        self.parent.tags.add(tag, Tag.objects.create(name='Importante'))
+        self.child = Task.objects.create(title='Hija, con coma', user=self.user, parent_task=self.parent, state='doing')
+        user2 = User.objects.create_user(username='user2', password='password2')
+        Task.objects.create(title='Ajena', user=user2)
+
+    def test_export_ndjson(self):
+        response = self.client.get('/api/tasks/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Padre', 'Hija, con coma'])
+        self.assertEqual(rows[0]['expiration_date'], '2024-11-17')
+        self.assertEqual(sorted(tag['name'] for tag in rows[0]['tags']), ['Importante', 'Urgente'])
+        self.assertEqual(rows[1]['parent_task'], self.parent.id)
+
+    def test_export_csv_with_filters(self):
+        response = self.client.get('/api/tasks/export/?output=csv&state=doing')
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Hija, con coma')
+        self.assertEqual(rows[0]['parent_task'], str(self.parent.id))
+
+        response = self.client.get('/api/tasks/export/?output=csv&tags=Urgente')
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row['title'] for row in rows], ['Padre'])
+        self.assertEqual(sorted(rows[0]['tags'].split('|')), ['Importante', 'Urgente'])
+
+    def test_export_invalid_output(self):
+        response = self.client.get('/api/tasks/export/?output=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+class TaskImportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, name, content, **data):
+        file = SimpleUploadedFile(name, content.encode())
+        return self.client.post('/api/tasks/import/', { 'file': file, **data }, format='multipart')
+
+    def test_import_ndjson_with_parents_and_tags(self):
+        Tag.objects.create(name='Urgente')
+        lines = [
+            { 'id': 'c', 'title': 'Nieta', 'parent_task': 'b' },
+            { 'id': 'a', 'title': 'Abuela', 'tags': [{ 'name': 'Urgente' }, 'Nueva'], 'state': 'doing' },
+            { 'id': 'b', 'title': 'Madre', 'parent_task': 'a', 'expiration_date': '2024-11-17' },
+            { 'id': 'd', 'description': 'Sin título' },
+            { 'id': 'e', 'title': 'Huérfana', 'parent_task': 'zzz' },
+        ]
+        content = '\n'.join(json.dumps(line) for line in lines) + '\nno es json\n'
+        response = self.upload('tasks.ndjson', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'], 6)
+        self.assertEqual(response.data['created'], 4)
+        self.assertEqual([error['row'] for error in response.data['errors']], [4, 6])
+        self.assertEqual(response.data['unresolved_parents'], 1)
+        self.assertTrue(response.data['completed'])
+        grandma = Task.objects.get(title='Abuela')
+        self.assertEqual(grandma.state, 'doing')
+        self.assertEqual(set(grandma.tags.values_list('name', flat=True)), { 'Urgente', 'Nueva' })
+        self.assertEqual(Task.objects.get(title='Madre').parent_task, grandma)
+        self.assertEqual(Task.objects.get(title='Nieta').parent_task.title, 'Madre')
+        self.assertIsNone(Task.objects.get(title='Huérfana').parent_task)
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_import_csv_resumes_from_checkpoint(self):
+        rows = ['id,title,state,parent_task,tags']
+        rows += [f'{i},Tarea {i},pending,{i - 1 if i else ""},a|b' for i in range(5)]
+        content = '\n'.join(rows) + '\n'
+        with self.settings(TASKS_IMPORT_BATCH_SIZE=2):
+            response = self.upload('tasks.csv', content, max_rows=3)
+            self.assertEqual(response.data['checkpoint'], 3)
+            self.assertFalse(response.data['completed'])
+            response = self.upload('tasks.csv', content, resume=response.data['import'])
+        self.assertEqual(response.data['rows'], 2)
+        self.assertTrue(response.data['completed'])
+        self.assertEqual(Task.objects.count(), 5)
+        for i in range(1, 5):
+            self.assertEqual(Task.objects.get(title=f'Tarea {i}').parent_task.title, f'Tarea {i - 1}')
+        self.assertEqual(Task.tags.through.objects.count(), 10)
+        response = self.upload('tasks.csv', content, resume=response.data['import'])
+        self.assertEqual(response.status_code, 404)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as file:
+            file.write(json.dumps({ 'title': 'Desde comando' }) + '\n')
+        out = StringIO()
+        call_command('import_tasks', file.name, user='user', stdout=out)
+        os.unlink(file.name)
+        self.assertEqual(json.loads(out.getvalue())['created'], 1)
+        self.assertTrue(Task.objects.filter(title='Desde comando', user=self.user).exists())
+
+    def test_import_csv_with_bom(self):
+        response = self.upload('tasks.csv', '\ufefftitle,state\nUna,doing\n')
+        self.assertEqual((response.data['created'], response.data['error_count']), (1, 0))
+        self.assertEqual(Task.objects.get(title='Una').state, 'doing')
+
+    def test_unreadable_file_keeps_committed_batches(self):
+        # Past the first chunk TextIOWrapper decodes, so some batches are committed before the bad bytes.
+        content = ''.join(json.dumps({ 'title': f'Tarea {i:04d}' }) + '\n' for i in range(400)).encode()
+        content += '{"title": "Canción"}\n'.encode('latin-1')
+        with self.settings(TASKS_IMPORT_BATCH_SIZE=50):
+            response = self.client.post('/api/tasks/import/', {
+                'file': SimpleUploadedFile('tasks.ndjson', content)
+            }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.data['error'])
+        self.assertFalse(response.data['completed'])
+        self.assertGreater(response.data['checkpoint'], 0)
+        self.assertEqual(response.data['checkpoint'] % 50, 0)
+        self.assertEqual(Task.objects.count(), response.data['checkpoint'])
+
+        response = self.upload('tasks.csv', 'title\n"' + 'x' * 200000 + '"\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('CSV', response.data['error'])
+
+        with tempfile.NamedTemporaryFile('wb', suffix='.ndjson', delete=False) as file:
+            file.write('{"title": "Canción"}\n'.encode('latin-1'))
+        with self.assertRaises(CommandError):
+            call_command('import_tasks', file.name, user='user', stdout=StringIO())
+        os.unlink(file.name)
+
+
+class TaskFieldsetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.root = Task.objects.create(title='Raíz', user=self.user)
+        self.root.tags.add(Tag.objects.create(name='Urgente'))
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+        Task.objects.create(title='Nieta', user=self.user, parent_task=child)
+
+    def test_sparse_fields(self):
+        response = self.client.get('/api/tasks/?fields=id,title,state', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), { 'id', 'title', 'state' })
+        response = self.client.get(f'/api/tasks/{self.root.id}/?exclude=description,tags', format='json')
+        self.assertNotIn('tags', response.data)
+        self.assertNotIn('description', response.data)
+        self.assertNotIn('tags', response.data['subtasks'][0])
+
+    def test_depth_limits_nesting(self):
+        response = self.client.get(f'/api/tasks/{self.root.id}/?depth=1', format='json')
+        self.assertEqual(response.data['subtasks'][0]['title'], 'Hija')
+        self.assertNotIn('subtasks', response.data['subtasks'][0])
+        response = self.client.get(f'/api/tasks/{self.root.id}/?depth=0', format='json')
+        self.assertNotIn('subtasks', response.data)
+        response = self.client.get(f'/api/tasks/{self.root.id}/?depth=-1', format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unrequested_fields_skip_their_queries(self):
+        # ETag validators, count and page only: no tags prefetch and no subtree query.
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/tasks/?fields=id,title,state', format='json')
+        self.assertEqual(len(response.data['results']), 3)
+        # Tags query but no subtree query.
+        with self.assertNumQueries(5):
+            self.client.get('/api/tasks/?depth=0', format='json')
+
+    def test_writes_ignore_fieldsets(self):
+        response = self.client.patch(f'/api/tasks/{self.root.id}/?fields=id', { 'title': 'Nueva' }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Nueva')
+
+
+class FastListParityTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        urgent, important = Tag.objects.create(name='Urgente'), Tag.objects.create(name='Importante')
+        root = Task.objects.create(
+            title='Raíz', description='Con "comillas"', user=self.user, expiration_date='2024-11-17'
+        )
+        root.tags.add(urgent, important)
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=root, state='doing')
+        child.tags.add(important)
+        Task.objects.create(title='Nieta', user=self.user, parent_task=child, state='complete')
+        Task.objects.create(title='Suelta ñ', user=self.user)
+
+    def test_output_is_byte_identical(self):
+        renderer = JSONRenderer()
+        queryset = Task.objects.filter(user=self.user).order_by('id')
+        for query in ['', 'fields=id,title,subtasks', 'exclude=tags', 'depth=1', 'depth=0']:
+            context = parse_fieldset(QueryDict(query))
+            serializer = TaskSerializer(queryset.prefetch_related('tags'), many=True, context=context)
+            expected = renderer.render(serializer.data)
+            fast = renderer.render(serialize_task_rows(queryset.values(*TASK_VALUES), context))
+            self.assertEqual(fast, expected, query)
+
+    def test_api_responses_match(self):
+        for query in ['', '?state=doing', '?tags=Importante&depth=1', '?pagination=cursor&page_size=2']:
+            with self.settings(TASKS_FAST_LIST=True):
+                fast = self.client.get(f'/api/tasks/{query}', format='json')
+            cache.clear()
+            with self.settings(TASKS_FAST_LIST=False):
+                slow = self.client.get(f'/api/tasks/{query}', format='json')
+            cache.clear()
+            self.assertEqual(fast.content, slow.content, query)
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_task_list', tasks=30, page_size=10, repeat=1, stdout=out)
+        self.assertTrue(json.loads(out.getvalue())['identical'])
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        auth_buckets.clear()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client = APIClient()
+        response = self.client.post('/api/login/', { 'username': 'user', 'password': 'password' }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    def user_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [query for query in queries if '"auth_user"' in query['sql']]
+
+    def test_user_is_loaded_once(self):
+        self.assertEqual(len(self.user_queries('/api/tags/')), 1)
+        self.assertEqual(len(self.user_queries('/api/tags/')), 0)
+        self.assertEqual(len(self.user_queries('/api/tasks/')), 0)
+
+    def test_saving_the_user_invalidates_it(self):
+        self.user_queries('/api/tags/')
+        self.user.set_password('otra-password')
+        self.user.save()
+        self.assertEqual(len(self.user_queries('/api/tags/')), 1)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/api/tags/', format='json')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(JWT_USER_CACHE_TTL=0)
+    def test_entries_expire(self):
+        self.user_queries('/api/tags/')
+        self.assertEqual(len(self.user_queries('/api/tags/')), 1)
+
+    @override_settings(JWT_USER_CACHE_SHARED=True)
+    def test_shared_tier(self):
+        self.user_queries('/api/tags/')
+        user_cache.clear()
+        self.assertEqual(len(self.user_queries('/api/tags/')), 0)
+        self.user.save()
+        user_cache.clear()
+        self.assertEqual(len(self.user_queries('/api/tags/')), 1)
+
+
+class AsyncTaskEndpointsTestCase(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        auth_buckets.clear()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client = APIClient()
+        response = self.client.post('/api/login/', { 'username': 'user', 'password': 'password' }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.async_client = AsyncClient()
+        self.headers = { 'Authorization': f'Bearer {response.data["access"]}' }
+        urgent = Tag.objects.create(name='Urgente')
+        self.root = Task.objects.create(title='Raíz', user=self.user, expiration_date='2024-11-17')
+        self.root.tags.add(urgent)
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root, state='doing')
+        Task.objects.create(title='Nieta', user=self.user, parent_task=child)
+        for i in range(11):
+            Task.objects.create(title=f'Tarea {i}', user=self.user)
+        other = User.objects.create_user(username='other', password='password')
+        self.foreign = Task.objects.create(title='Ajena', user=other)
+
+    async def test_list_matches_sync_endpoint(self):
+        queries = ['', '?page=2', '?page_size=3&page=2', '?state=doing', '?tags=Urgente&depth=1', '?fields=id,title']
+        for query in queries:
+            response = await self.async_client.get(f'/api/async/tasks/{query}', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            expected = await sync_to_async(self.client.get)(f'/api/tasks/{query}', format='json')
+            self.assertEqual(response.content.replace(b'/api/async/tasks/', b'/api/tasks/'), expected.content, query)
+
+    async def test_detail_matches_sync_endpoint(self):
+        response = await self.async_client.get(f'/api/async/tasks/{self.root.id}/?depth=1', headers=self.headers)
+        expected = await sync_to_async(self.client.get)(f'/api/tasks/{self.root.id}/?depth=1', format='json')
+        self.assertEqual(response.content, expected.content)
+        response = await self.async_client.get(f'/api/async/tasks/{self.foreign.id}/', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def post(self, data):
+        return self.async_client.post('/api/async/tasks/', data, content_type='application/json', headers=self.headers)
+
+    async def test_create(self):
+        data = { 'title': 'Nueva', 'parent_task': self.root.id, 'tags': [{ 'name': 'Urgente' }, { 'name': 'Nueva' }] }
+        response = await self.post(data)
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['parent_task'], self.root.id)
+        self.assertEqual(body['user'], self.user.id)
+        self.assertEqual(body['tags'], [{ 'name': 'Nueva' }, { 'name': 'Urgente' }])
+        task = await Task.objects.aget(id=body['id'])
+        self.assertEqual(await task.tags.acount(), 2)
+
+    async def test_create_validation(self):
+        response = await self.post({ 'title': '' })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('title', response.json())
+        response = await self.post({ 'title': 'Hija', 'parent_task': self.foreign.id })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), { 'parent_task': 'Tarea padre no encontrada.' })
+
+    async def test_authentication_is_required(self):
+        response = await AsyncClient().get('/api/async/tasks/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+        response = await self.async_client.delete(f'/api/async/tasks/{self.root.id}/', headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+
+
+class BenchAsgiCommandTestCase(TransactionTestCase):
+    def test_command(self):
+        out = StringIO()
+        call_command('bench_asgi', tasks=5, depth=0, requests=4, concurrency=2, stdout=out)
+        report = json.loads(out.getvalue())
+        for endpoint in ('task_list', 'task_detail'):
+            self.assertEqual(report[endpoint]['wsgi']['errors'], 0)
+            self.assertEqual(report[endpoint]['asgi']['errors'], 0)
+        self.assertFalse(Task.objects.exists())
+
+
+class TaskPathTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.root = Task.objects.create(title='Raíz', user=self.user)
+        self.child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+        self.grandchild = Task.objects.create(title='Nieta', user=self.user, parent_task=self.child)
+        self.other = Task.objects.create(title='Otra', user=self.user)
+
+    def paths(self):
+        return dict(Task.objects.values_list('title', 'path'))
+
+    def test_paths_are_maintained_on_insert_and_reparent(self):
+        self.assertEqual(self.paths()['Nieta'], f'{self.root.id}/{self.child.id}/')
+        response = self.client.patch(f'/api/tasks/{self.child.id}/', { 'parent_task': self.other.id }, format='json')
+        self.assertEqual(response.status_code, 200)
+        paths = self.paths()
+        self.assertEqual(paths['Hija'], f'{self.other.id}/')
+        self.assertEqual(paths['Nieta'], f'{self.other.id}/{self.child.id}/')
+        self.client.patch(f'/api/tasks/{self.child.id}/', { 'parent_task': None }, format='json')
+        self.assertEqual(self.paths()['Nieta'], f'{self.child.id}/')
+
+    def test_cycles_are_rejected(self):
+        for parent in (self.root, self.grandchild):
+            response = self.client.patch(f'/api/tasks/{self.root.id}/', { 'parent_task': parent.id }, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('parent_task', response.data)
+        operations = [
+            { 'op': 'update', 'id': self.other.id, 'data': { 'parent_task': self.grandchild.id } },
+            { 'op': 'update', 'id': self.root.id, 'data': { 'parent_task': self.other.id } },
+        ]
+        response = self.client.post('/api/tasks/bulk/', operations, format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], ['ok', 'error'])
+        self.assertIsNone(Task.objects.get(id=self.root.id).parent_task_id)
+
+    def test_import_cycles_stay_unresolved(self):
+        rows = [
+            { 'id': 'a', 'title': 'A', 'parent_task': 'b' },
+            { 'id': 'b', 'title': 'B', 'parent_task': 'a' },
+            { 'id': 'c', 'title': 'C', 'parent_task': 'b' },
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows).encode()
+        response = self.client.post(
+            '/api/tasks/import/', { 'file': SimpleUploadedFile('tasks.ndjson', content) }, format='multipart'
+        )
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(response.data['unresolved_parents'], 1)
+        a, b, c = (Task.objects.get(title=title) for title in 'ABC')
+        self.assertEqual(c.path, f'{b.path}{b.id}/')
+        self.assertTrue(a.parent_task_id is None or b.parent_task_id is None)
+
+    def test_descendants_and_ancestors(self):
+        Task.objects.create(title='Bisnieta', user=self.user, parent_task=self.grandchild)
+        response = self.client.get(f'/api/tasks/{self.root.id}/descendants/', format='json')
+        self.assertEqual([task['title'] for task in response.data['results']], ['Hija', 'Nieta', 'Bisnieta'])
+        self.assertNotIn('subtasks', response.data['results'][0])
+        response = self.client.get(f'/api/tasks/{self.grandchild.id}/ancestors/', format='json')
+        self.assertEqual([task['title'] for task in response.data], ['Raíz', 'Hija'])
+        # Task lookup, the ancestors and their tags, whatever the depth.
+        with self.assertNumQueries(3):
+            self.client.get(f'/api/tasks/{self.grandchild.id}/ancestors/?exclude=subtasks', format='json')
+
+    def test_delete_removes_the_subtree(self):
+        response = self.client.delete(f'/api/tasks/{self.root.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(Task.objects.values_list('title', flat=True)), ['Otra'])
+
+
+class SubtaskCountersTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.root = Task.objects.create(title='Raíz', user=self.user)
+        self.other = Task.objects.create(title='Otra', user=self.user)
+
+    def counters(self, task):
+        task.refresh_from_db()
+        return task.subtask_count, task.completed_subtask_count
+
+    def assert_no_drift(self):
+        self.assertEqual(rebuild_counters(fix=False)[1], [])
+
+    def test_counters_follow_writes(self):
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+        done = Task.objects.create(title='Hecha', user=self.user, parent_task=self.root, state='complete')
+        self.assertEqual(self.counters(self.root), (2, 1))
+        response = self.client.get(f'/api/tasks/{self.root.id}/', format='json')
+        self.assertEqual((response.data['subtask_count'], response.data['completed_subtask_count']), (2, 1))
+
+        self.client.patch(f'/api/tasks/{child.id}/', { 'state': 'complete' }, format='json')
+        self.assertEqual(self.counters(self.root), (2, 2))
+        self.client.patch(f'/api/tasks/{done.id}/', { 'parent_task': self.other.id }, format='json')
+        self.assertEqual(self.counters(self.root), (1, 1))
+        self.assertEqual(self.counters(self.other), (1, 1))
+        self.client.delete(f'/api/tasks/{child.id}/')
+        self.assertEqual(self.counters(self.root), (0, 0))
+        done.delete()
+        self.assertEqual(self.counters(self.other), (0, 0))
+        self.assert_no_drift()
+
+    def test_stale_instances_do_not_overwrite_counters(self):
+        stale = Task.objects.get(id=self.root.id)
+        Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+        stale.title = 'Renombrada'
+        stale.save()
+        self.assertEqual(self.counters(self.root), (1, 0))
+
+    @override_settings(TASKS_SUBTASK_ROLLUP=True)
+    def test_rollup_through_ancestors(self):
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+        grandchild = Task.objects.create(title='Nieta', user=self.user, parent_task=child, state='complete')
+        Task.objects.create(title='Bisnieta', user=self.user, parent_task=grandchild)
+        self.assertEqual(self.counters(self.root), (3, 1))
+        self.client.patch(f'/api/tasks/{grandchild.id}/', { 'parent_task': self.other.id }, format='json')
+        self.assertEqual(self.counters(self.root), (1, 0))
+        self.assertEqual(self.counters(self.other), (2, 1))
+        self.client.delete(f'/api/tasks/{grandchild.id}/')
+        self.assertEqual(self.counters(self.other), (0, 0))
+        self.assert_no_drift()
+
+    def test_bulk_and_import_keep_counters(self):
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+        operations = [
+            { 'op': 'create', 'data': { 'title': 'Nueva', 'parent_task': self.root.id, 'state': 'complete' } },
+            { 'op': 'update', 'id': child.id, 'data': { 'parent_task': self.other.id, 'state': 'complete' } },
+            { 'op': 'update', 'id': self.other.id, 'data': { 'state': 'doing' } },
+        ]
+        response = self.client.post('/api/tasks/bulk/', operations, format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], ['ok', 'ok', 'ok'])
+        self.assertEqual(self.counters(self.root), (1, 1))
+        self.assertEqual(self.counters(self.other), (1, 1))
+        rows = [
+            { 'id': 'b', 'title': 'B', 'parent_task': 'a', 'state': 'complete' },
+            { 'id': 'a', 'title': 'A' },
+            { 'id': 'c', 'title': 'C', 'parent_task': 'a' },
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows).encode()
+        self.client.post('/api/tasks/import/', { 'file': SimpleUploadedFile('t.ndjson', content) }, format='multipart')
+        self.assertEqual(self.counters(Task.objects.get(title='A')), (2, 1))
+        self.client.post('/api/tasks/bulk/', [{ 'op': 'delete', 'id': self.other.id }], format='json')
+        self.assert_no_drift()
+
+    def test_rebuild_command(self):
+        Task.objects.create(title='Hija', user=self.user, parent_task=self.root, state='complete')
+        Task.objects.filter(id=self.root.id).update(subtask_count=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_subtask_counts', check=True, stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_subtask_counts', batch_size=1, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['fixed'], 1)
+        self.assertEqual(self.counters(self.root), (1, 1))
+
+    def test_rollup_rebuild_queries_per_batch(self):
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+        grandchild = Task.objects.create(title='Nieta', user=self.user, parent_task=child, state='complete')
+        Task.objects.create(title='Bisnieta', user=self.user, parent_task=grandchild, state='complete')
+        Task.objects.update(subtask_count=0, completed_subtask_count=0)
+        with self.settings(TASKS_SUBTASK_ROLLUP=True):
+            # Per batch, the locked tasks and their descendants by constant prefix, plus the fix; then the empty
+            # batch. Each batch has its own transaction, a savepoint inside the test case.
+            with self.assertNumQueries(8):
+                checked, drifted = rebuild_counters(batch_size=10)
+            self.assertEqual((checked, len(drifted)), (5, 3))
+            self.assertEqual([self.counters(task) for task in [self.root, child, grandchild]], [(3, 2), (2, 2), (1, 1)])
+            rebuild_counters(batch_size=1)
+            self.assert_no_drift()
+
+
+class TaskSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.urgent = Tag.objects.create(name='Urgente')
+        self.title = Task.objects.create(title='Comprar leche', description='En el súper', user=self.user)
+        self.title.tags.add(self.urgent)
+        self.description = Task.objects.create(
+            title='Recados', description='Pasar por la tienda a comprar pan', user=self.user, state='doing'
+        )
+        Task.objects.create(title='Llamar', description='Al médico', user=self.user)
+        other = User.objects.create_user(username='other', password='password')
+        Task.objects.create(title='Comprar leche', user=other)
+
+    def search(self, query):
+        response = self.client.get(f'/api/tasks/?{query}', format='json')
+        self.assertEqual(response.status_code, 200)
+        return [task['id'] for task in response.data['results']]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('q=comprar'), [self.title.id, self.description.id])
+        self.assertEqual(self.search('q=medico'), [self.title.id + 2])
+        self.assertEqual(self.search('q=comprar pan'), [self.description.id])
+        self.assertEqual(self.search('q="*)('), [])
+
+    def test_cursor_pagination_is_rejected(self):
+        response = self.client.get('/api/tasks/?q=comprar&pagination=cursor', format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('q', response.data)
+        with self.settings(TASKS_PAGINATION_MODE='cursor'):
+            self.assertEqual(self.client.get('/api/tasks/?q=comprar', format='json').status_code, 400)
+            response = self.client.get('/api/tasks/?q=comprar&pagination=page', format='json')
+            self.assertEqual([task['id'] for task in response.data['results']], [self.title.id, self.description.id])
+
+    def test_combines_with_filters(self):
+        self.assertEqual(self.search('q=comprar&state=doing'), [self.description.id])
+        self.assertEqual(self.search('q=comprar&tags=Urgente'), [self.title.id])
+
+    def test_index_follows_writes(self):
+        Task.objects.filter(id=self.title.id).update(title='Vender leche')
+        self.description.delete()
+        self.assertEqual(self.search('q=comprar'), [])
+        self.assertEqual(self.search('q=vender'), [self.title.id])
+
+    def test_fast_list_matches(self):
+        for query in ['q=comprar', 'q=comprar&tags=Urgente', 'q=comprar&pagination=cursor']:
+            with self.settings(TASKS_FAST_LIST=True):
+                fast = self.client.get(f'/api/tasks/?{query}', format='json')
+            cache.clear()
+            with self.settings(TASKS_FAST_LIST=False):
+                slow = self.client.get(f'/api/tasks/?{query}', format='json')
+            cache.clear()
+            self.assertEqual(fast.content, slow.content, query)
+
+
+class TaskFacetsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        urgent, home = Tag.objects.create(name='Urgente'), Tag.objects.create(name='Casa')
+        Task.objects.create(title='Vencida', user=self.user, expiration_date='2000-01-01').tags.add(urgent, home)
+        upcoming = Task.objects.create(title='Próxima', user=self.user, expiration_date='2999-01-01', state='doing')
+        upcoming.tags.add(home)
+        self.task = Task.objects.create(title='Sin fecha', user=self.user, state='complete')
+        Task.objects.create(title='Ajena', user=User.objects.create_user(username='other', password='password'))
+
+    def test_counts(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/tasks/facets/', format='json')
+        self.assertEqual(response.data, {
+            'count': 3,
+            'state': { 'pending': 1, 'doing': 1, 'complete': 1 },
+            'expiration_date': { 'overdue': 1, 'upcoming': 1, 'none': 1 },
+            'tags': { 'Casa': 2, 'Urgente': 1 },
+        })
+        response = self.client.get('/api/tasks/facets/?tags=Casa&state=doing', format='json')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['tags'], { 'Casa': 1 })
+
+    def test_cached_until_tasks_change(self):
+        self.client.get('/api/tasks/facets/', format='json')
+        response = self.client.get('/api/tasks/facets/', format='json')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.client.patch(f'/api/tasks/{self.task.id}/', { 'state': 'pending' }, format='json')
+        response = self.client.get('/api/tasks/facets/', format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['state']['pending'], 2)
+
+
+class BulkTransitionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        sprint = Tag.objects.create(name='sprint-12')
+        self.root = Task.objects.create(title='Raíz', user=self.user)
+        self.doing = Task.objects.create(title='En curso', user=self.user, parent_task=self.root, state='doing')
+        self.doing.tags.add(sprint)
+        self.child = Task.objects.create(title='Hija', user=self.user, parent_task=self.doing)
+        self.untagged = Task.objects.create(title='Sin etiqueta', user=self.user, state='doing')
+        other = User.objects.create_user(username='other', password='password')
+        self.foreign = Task.objects.create(title='Ajena', user=other, state='doing')
+        self.foreign.tags.add(sprint)
+
+    def states(self):
+        return dict(Task.objects.values_list('id', 'state'))
+
+    def test_filtered_transition(self):
+        self.client.get('/api/tasks/', format='json')
+        response = self.client.post(
+            '/api/tasks/bulk_transition/?state=doing&tags=sprint-12', { 'state': 'complete' }, format='json'
+        )
+        self.assertEqual(response.data, { 'updated': 1 })
+        states = self.states()
+        self.assertEqual(states[self.doing.id], 'complete')
+        self.assertEqual((states[self.untagged.id], states[self.foreign.id]), ('doing', 'doing'))
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.completed_subtask_count, 1)
+        self.assertEqual(self.client.get('/api/tasks/', format='json')['X-Cache'], 'MISS')
+        self.assertEqual(rebuild_counters(fix=False)[1], [])
+
+    def test_include_subtasks(self):
+        response = self.client.post(
+            '/api/tasks/bulk_transition/?tags=sprint-12', { 'state': 'complete', 'include_subtasks': True },
+            format='json'
+        )
+        self.assertEqual(response.data, { 'updated': 2 })
+        self.assertEqual(self.states()[self.child.id], 'complete')
+        self.assertEqual(self.states()[self.foreign.id], 'doing')
+        self.assertEqual(rebuild_counters(fix=False)[1], [])
+        with self.settings(TASKS_SUBTASK_ROLLUP=True):
+            rebuild_counters()
+            response = self.client.post(
+                '/api/tasks/bulk_transition/', { 'state': 'pending', 'include_subtasks': True }, format='json'
+            )
+            self.assertEqual(response.data, { 'updated': 3 })
+            self.assertEqual(rebuild_counters(fix=False)[1], [])
+
+    def test_invalid_state(self):
+        response = self.client.post('/api/tasks/bulk_transition/', { 'state': 'done' }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(TestCase):
+    """A second SQLite database stands in for the replica; rows only written there show where reads went."""
+    # Resolved in setUpClass, once the replica connection exists.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict,
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+            'OPTIONS': {},
+            'TEST': { 'NAME': None, 'MIRROR': None, 'CHARSET': None, 'COLLATION': None, 'MIGRATE': True },
+        }
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        Task.objects.create(title='Primaria', user=self.user)
+        User.objects.using('replica').create(id=self.user.id, username='user')
+        Task.objects.using('replica').create(title='Réplica', user_id=self.user.id)
+
+    def titles(self):
+        response = self.client.get('/api/tasks/', format='json')
+        return [task['title'] for task in response.data['results']]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.titles(), ['Réplica'])
+        response = self.client.get('/api/tags/', format='json')
+        self.assertEqual(response.status_code, 200)
+        # The replica is only used for the request.
+        self.assertEqual(Task.objects.db, 'default')
+        with self.settings(DATABASE_REPLICAS=[]):
+            cache.clear()
+            self.assertEqual(self.titles(), ['Primaria'])
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        response = self.client.post('/api/tasks/', { 'title': 'Nueva' }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.titles(), ['Primaria', 'Nueva'])
+        self.assertTrue(cache.get(pin_key(self.user.id)))
+        # Expires the pin, and the list response cached from the primary with it.
+        cache.clear()
+        self.assertEqual(self.titles(), ['Réplica'])
+        self.client.post('/api/tasks/', {}, format='json')
+        self.assertEqual(self.titles(), ['Réplica'])
+
+
+class TaskArchiveTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='Hecho')
+        self.root = Task.objects.create(title='Raíz', user=self.user, state='complete')
+        self.root.tags.add(self.tag)
+        self.child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root, state='complete')
+        Task.objects.create(title='Nieta', user=self.user, parent_task=self.child, state='complete')
+        self.open = Task.objects.create(title='Abierta', user=self.user, state='complete')
+        Task.objects.create(title='Pendiente', user=self.user, parent_task=self.open)
+        self.recent = Task.objects.create(title='Reciente', user=self.user, state='complete')
+        old = timezone.now() - timedelta(days=100)
+        Task.objects.exclude(pk=self.recent.pk).update(updated_at=old)
+
+    def archive(self, **options):
+        out = StringIO()
+        call_command('archive_tasks', stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_archive_and_restore(self):
+        self.assertEqual(self.archive(batch_size=1), { 'batches': 2, 'trees': 1, 'tasks': 3, 'last_id': self.open.id })
+        self.assertEqual(set(Task.objects.values_list('title', flat=True)), { 'Abierta', 'Pendiente', 'Reciente' })
+        self.assertEqual(self.archive()['tasks'], 0)
+
+        response = self.client.get('/api/tasks/?archived=true&tags=Hecho', format='json')
+        self.assertEqual([task['title'] for task in response.data['results']], ['Raíz'])
+        self.assertEqual(response.data['results'][0]['tags'], [{ 'name': 'Hecho' }])
+        response = self.client.get('/api/tasks/?archived=true&q=niet', format='json')
+        self.assertEqual([task['parent_task'] for task in response.data['results']], [self.child.id])
+
+        self.assertEqual(self.client.post(f'/api/tasks/{self.child.id}/restore/').status_code, 404)
+        response = self.client.post(f'/api/tasks/{self.root.id}/restore/', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['id'], response.data['subtask_count']), (self.root.id, 1))
+        self.assertEqual(response.data['subtasks'][0]['subtasks'][0]['title'], 'Nieta')
+        self.assertEqual(list(self.root.tags.all()), [self.tag])
+        self.assertFalse(TaskArchive.objects.exists())
+        self.assertEqual(rebuild_counters(fix=False)[1], [])
+
+    def test_blocked_roots_are_skipped(self):
+        result = self.archive(after_id=self.root.id, batch_size=1)
+        self.assertEqual((result['trees'], result['last_id']), (0, self.open.id))
+        self.assertTrue(Task.objects.filter(parent_task=self.open, state='pending').exists())
+
+    def test_resume_after_id(self):
+        result = self.archive(after_id=self.root.id, max_batches=1)
+        self.assertEqual(result['tasks'], 0)
+        self.assertTrue(Task.objects.filter(pk=self.root.pk).exists())
+
+
+@override_settings(
+    AUTH_THROTTLE_IP_BURST=3, AUTH_THROTTLE_IP_PER_MINUTE=1,
+    AUTH_THROTTLE_USERNAME_BURST=2, AUTH_THROTTLE_USERNAME_PER_MINUTE=1,
+)
+class AuthThrottleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        auth_buckets.clear()
+        User.objects.create_user(username='user', password='password')
+
+    def login(self, username='user', ip='10.0.0.1'):
+        return self.client.post(
+            '/api/login/', { 'username': username, 'password': 'wrong' }, content_type='application/json',
+            REMOTE_ADDR=ip,
+        )
+
+    def test_rejected_before_hashing(self):
+        self.assertEqual([self.login().status_code for _ in range(2)], [401, 401])
+        with mock.patch('rest_framework_simplejwt.serializers.authenticate') as authenticate:
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        authenticate.assert_not_called()
+
+    def test_buckets_per_ip_and_username(self):
+        self.login(ip='10.0.0.1')
+        self.login(ip='10.0.0.2')
+        # The username bucket is empty whatever the address.
+        self.assertEqual(self.login(ip='10.0.0.3').status_code, 429)
+        self.assertEqual(self.login('other', ip='10.0.0.3').status_code, 401)
+        self.login('another', ip='10.0.0.3')
+        self.assertEqual(self.login('yet-another', ip='10.0.0.3').status_code, 429)
+        signup = self.client.post('/api/signup/', { 'username': 'new', 'password': 'password' }, REMOTE_ADDR='10.0.0.3')
+        self.assertEqual(signup.status_code, 429)
+        signup = self.client.post('/api/signup/', { 'username': 'new', 'password': 'password' })
+        self.assertEqual(signup.status_code, 201)
+
+    def test_shared_tier(self):
+        with self.settings(AUTH_THROTTLE_SHARED=True):
+            self.login()
+            self.login()
+            # Another process starts from empty local buckets, but shares the cache.
+            auth_buckets.clear()
+            self.assertEqual(self.login().status_code, 429)
+        with self.settings(AUTH_THROTTLE_ENABLED=False):
+            self.assertEqual(self.login().status_code, 401)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    AUTH_THROTTLE_IP_BURST=1, AUTH_THROTTLE_IP_PER_MINUTE=1,
+    AUTH_THROTTLE_USERNAME_BURST=1, AUTH_THROTTLE_USERNAME_PER_MINUTE=1,
+)
+class BenchLoginFloodCommandTestCase(TransactionTestCase):
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            'bench_login_flood', tasks=5, requests=40, concurrency=2, flood_threads=4, flood_ips=1, warmup=0.5,
+            compare=True, stdout=out,
+        )
+        report = json.loads(out.getvalue())
+        throttled = report['throttled']
+        self.assertEqual(throttled['during_flood']['errors'], 0)
+        # Past the burst the flood is answered with 429 before any work, so the task list keeps its latency.
+        self.assertEqual((throttled['flood']['rejected_credentials'], throttled['flood']['throttled'] > 0), (1, True))
+        self.assertLess(throttled['p95_slowdown'], 2)
+        self.assertEqual(report['unthrottled']['flood']['throttled'], 0)
+        self.assertFalse(Task.objects.exists())
+
+
+class RendererNegotiationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.root = Task.objects.create(
+            title='Raíz\u2028"comillas"', description='ñ', user=self.user, expiration_date='2024-11-17'
+        )
+        self.root.tags.add(Tag.objects.create(name='Urgente'))
+        Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+
+    def test_orjson_matches_json_renderer(self):
+        for path in ['/api/tags/', '/api/tasks/facets/', '/api/tasks/', f'/api/tasks/{self.root.id}/']:
+            response = self.client.get(path)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.content, JSONRenderer().render(response.data), path)
+        self.assertIn(b'\\u2028', response.content)
+
+    def test_msgpack(self):
+        for path in ['/api/tasks/', f'/api/tasks/{self.root.id}/', '/api/tasks/facets/']:
+            json_response = self.client.get(path)
+            response = self.client.get(path, HTTP_ACCEPT='application/msgpack')
+            self.assertEqual(response['Content-Type'], 'application/msgpack')
+            self.assertEqual(msgpack.unpackb(response.content), json_response.json(), path)
+            self.assertLess(len(response.content), len(json_response.content))
+        response = self.client.post(
+            '/api/tasks/', msgpack.packb({ 'title': 'Binaria', 'tags': [{ 'name': 'Binaria' }] }),
+            content_type='application/msgpack', HTTP_ACCEPT='application/msgpack',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['tags'], [{ 'name': 'Binaria' }])
+        response = self.client.post('/api/tasks/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag_per_representation(self):
+        json_response = self.client.get('/api/tasks/')
+        response = self.client.get('/api/tasks/', HTTP_ACCEPT='application/msgpack')
+        self.assertNotEqual(response['ETag'], json_response['ETag'])
+        self.assertIn('Accept', response['Vary'])
+        response = self.client.get(
+            '/api/tasks/', HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=json_response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+
+    async def test_async_endpoints(self):
+        headers = { 'Authorization': f'Bearer {AccessToken.for_user(self.user)}', 'Accept': 'application/msgpack' }
+        response = await AsyncClient().get(f'/api/async/tasks/{self.root.id}/', headers=headers)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['title'], self.root.title)
+        response = await AsyncClient().post(
+            '/api/async/tasks/', msgpack.packb({ 'title': 'Binaria' }), content_type='application/msgpack',
+            headers=headers,
+        )
+        self.assertEqual((response.status_code, msgpack.unpackb(response.content)['title']), (201, 'Binaria'))
+        response = await AsyncClient().get('/api/async/tasks/', headers={ **headers, 'Accept': 'text/csv' })
+        self.assertEqual(response.status_code, 406)
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_renderers', page_size=3, depth=1, fanout=2, repeat=2, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report), { 'json', 'orjson', 'msgpack' })
+        self.assertTrue(all(result['round_trip'] for result in report.values()))
+        self.assertEqual(report['orjson']['bytes'], report['json']['bytes'])
+        self.assertLess(report['msgpack']['bytes'], report['json']['bytes'])
+
+
+class TaskSyncTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.root = Task.objects.create(title='Raíz', user=self.user)
+        self.child = Task.objects.create(title='Hija', user=self.user, parent_task=self.root)
+        self.other = Task.objects.create(title='Otra', user=self.user)
+        Task.objects.create(title='Ajena', user=User.objects.create_user(username='other', password='password'))
+
+    def changes(self, since, **params):
+        response = self.client.get('/api/tasks/changes/', { 'since': since, **params })
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_changes_since_cursor(self):
+        data = self.changes(0)
+        self.assertCountEqual([task['title'] for task in data['tasks']], ['Raíz', 'Hija', 'Otra'])
+        self.assertEqual((data['deleted'], data['more']), ([], False))
+        self.assertNotIn('subtasks', data['tasks'][0])
+        cursor = data['cursor']
+        self.assertEqual(cursor, SyncCursor.objects.get(user=self.user).seq)
+        self.assertEqual(self.changes(cursor), { 'cursor': cursor, 'more': False, 'deleted': [], 'tasks': [] })
+
+        self.client.patch(f'/api/tasks/{self.other.id}/', { 'state': 'doing' }, format='json')
+        data = self.changes(cursor)
+        self.assertEqual([(task['id'], task['state']) for task in data['tasks']], [(self.other.id, 'doing')])
+        cursor = data['cursor']
+
+        # Tag links and writes that bypass the model count as changes too.
+        tag = Tag.objects.create(name='Urgente')
+        self.child.tags.add(tag)
+        data = self.changes(cursor)
+        self.assertEqual(
+            [(task['id'], task['tags']) for task in data['tasks']], [(self.child.id, [{ 'name': 'Urgente' }])]
+        )
+        Task.tags.through.objects.filter(task=self.child).delete()
+        Task.objects.filter(pk=self.other.pk).update(title='Cambiada')
+        data = self.changes(data['cursor'])
+        self.assertEqual([task['id'] for task in data['tasks']], [self.child.id, self.other.id])
+
+        # Deleting the root deletes the child too, which also changes the root before it goes.
+        self.client.delete(f'/api/tasks/{self.root.id}/')
+        data = self.changes(data['cursor'])
+        self.assertEqual((sorted(data['deleted']), data['tasks']), (sorted([self.root.id, self.child.id]), []))
+        self.assertEqual(TaskTombstone.objects.filter(user=self.user).count(), 2)
+
+    def test_limit(self):
+        self.client.post('/api/tasks/bulk_transition/', { 'state': 'complete' }, format='json')
+        other_id = self.other.id
+        self.other.delete()
+        seen, deleted, cursor = [], [], 0
+        while True:
+            data = self.changes(cursor, limit=2)
+            self.assertLessEqual(len(data['tasks']) + len(data['deleted']), 2)
+            seen += [task['id'] for task in data['tasks']]
+            deleted += data['deleted']
+            cursor = data['cursor']
+            if not data['more']:
+                break
+        self.assertEqual((sorted(seen), deleted), ([self.root.id, self.child.id], [other_id]))
+        response = self.client.get('/api/tasks/changes/', { 'since': 'x' })
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/tasks/changes/', { 'limit': 0 })
+        self.assertEqual(response.status_code, 400)
+
+    def test_prune_tombstones(self):
+        cursor = self.changes(0)['cursor']
+        self.other.delete()
+        self.client.delete(f'/api/tasks/{self.root.id}/')
+        TaskTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=40))
+        self.assertEqual(prune_tombstones(timezone.now() - timedelta(days=50)), 0)
+        out = StringIO()
+        call_command('prune_tombstones', batch_size=2, stdout=out)
+        self.assertEqual(json.loads(out.getvalue()), { 'batches': 2, 'tombstones': 3 })
+        self.assertFalse(TaskTombstone.objects.exists())
+
+        response = self.client.get('/api/tasks/changes/', { 'since': cursor })
+        self.assertEqual(response.status_code, 410)
+        pruned = SyncCursor.objects.get(user=self.user).pruned_seq
+        self.assertEqual(self.changes(pruned)['tasks'], [])
+        self.assertEqual(self.changes(0)['tasks'], [])
+
+
+class TagUsageTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.urgent, self.home, self.work = [Tag.objects.create(name=name) for name in ['Urgente', 'Casa', 'Trabajo']]
+        self.task = Task.objects.create(title='Tarea', user=self.user)
+
+    def usage(self, user=None):
+        return dict(TagUsage.objects.filter(user=user or self.user).values_list('tag__name', 'count'))
+
+    def assert_consistent(self):
+        out = StringIO()
+        call_command('rebuild_tag_usage', check=True, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['drifted'], 0)
+
+    def test_m2m_changes(self):
+        self.task.tags.add(self.urgent, self.home)
+        self.task.tags.add(self.urgent)
+        other = Task.objects.create(title='Otra', user=self.user)
+        self.urgent.tasks.add(other, Task.objects.create(title='Ajena', user=self.other))
+        self.assertEqual(self.usage(), { 'Urgente': 2, 'Casa': 1 })
+        self.assertEqual(self.usage(self.other), { 'Urgente': 1 })
+        self.task.tags.remove(self.urgent)
+        self.task.tags.set([self.work])
+        self.assertEqual(self.usage(), { 'Urgente': 1, 'Trabajo': 1 })
+        self.urgent.tasks.clear()
+        other.tags.add(self.work)
+        self.assertEqual(self.usage(), { 'Trabajo': 2 })
+        self.task.tags.clear()
+        self.assertEqual(self.usage(), { 'Trabajo': 1 })
+        self.assert_consistent()
+
+    def test_remove_unlinked_tag(self):
+        other = Task.objects.create(title='Otra', user=self.user)
+        self.task.tags.add(self.urgent)
+        other.tags.remove(self.urgent)
+        self.home.tasks.remove(self.task, other)
+        self.urgent.tasks.remove(other)
+        self.assertEqual(self.usage(), { 'Urgente': 1 })
+        self.urgent.tasks.remove(self.task, other)
+        self.assertEqual(self.usage(), {})
+        self.assert_consistent()
+
+    def test_direct_writers(self):
+        self.client.post('/api/tasks/', { 'title': 'API', 'tags': [{ 'name': 'Recado' }] }, format='json')
+        results = self.client.post('/api/tasks/bulk/', [
+            { 'op': 'create', 'data': { 'title': 'Bulk', 'tags': [{ 'name': 'Casa' }, { 'name': 'Nueva' }] } },
+            { 'op': 'update', 'id': self.task.id, 'data': { 'tags': [{ 'name': 'Casa' }] } },
+        ], format='json').data['results']
+        self.assertEqual(self.usage(), { 'Recado': 1, 'Casa': 2, 'Nueva': 1 })
+        self.client.post('/api/tasks/bulk/', [
+            { 'op': 'update', 'id': self.task.id, 'data': { 'tags': [{ 'name': 'Trabajo' }] } },
+            { 'op': 'delete', 'id': results[0]['id'] },
+        ], format='json')
+        self.assertEqual(self.usage(), { 'Recado': 1, 'Trabajo': 1 })
+        self.client.post('/api/tasks/import/', { 'file': SimpleUploadedFile(
+            'tasks.ndjson', b'{"title": "Importada", "tags": ["Casa", "Trabajo"]}\n'
+        ) })
+        self.assertEqual(self.usage(), { 'Recado': 1, 'Trabajo': 2, 'Casa': 1 })
+
+        # Archiving, restoring and deleting a tree move the links of its subtasks too.
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=self.task, state='complete')
+        child.tags.add(self.urgent)
+        Task.objects.filter(pk=self.task.pk).update(state='complete')
+        Task.objects.update(updated_at=timezone.now() - timedelta(days=100))
+        call_command('archive_tasks', stdout=StringIO())
+        self.assertEqual(self.usage(), { 'Recado': 1, 'Trabajo': 1, 'Casa': 1 })
+        self.client.post(f'/api/tasks/{self.task.id}/restore/')
+        self.assertEqual(self.usage(), { 'Recado': 1, 'Trabajo': 2, 'Casa': 1, 'Urgente': 1 })
+        Task.objects.get(pk=self.task.pk).delete()
+        self.assertEqual(self.usage(), { 'Recado': 1, 'Trabajo': 1, 'Casa': 1 })
+        self.client.delete(f'/api/tasks/{Task.objects.get(title="API").id}/')
+        self.assertEqual(self.usage(), { 'Trabajo': 1, 'Casa': 1 })
+        self.assert_consistent()
+
+    def test_queryset_delete(self):
+        child = Task.objects.create(title='Hija', user=self.user, parent_task=self.task)
+        other = Task.objects.create(title='Otra', user=self.user)
+        for task in [self.task, child, other]:
+            task.tags.add(self.urgent)
+        child.tags.add(self.home)
+        Task.objects.filter(pk__in=[self.task.pk, other.pk]).delete()
+        self.assertEqual(self.usage(), {})
+        self.assertEqual(rebuild_usage(fix=False)[1], [])
+
+    def test_rebuild(self):
+        self.task.tags.add(self.urgent)
+        TagUsage.objects.update(count=5)
+        TagUsage.objects.create(user=self.other, tag=self.home, count=1)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_tag_usage', check=True, stdout=out)
+        call_command('rebuild_tag_usage', stdout=StringIO())
+        self.assertEqual((self.usage(), self.usage(self.other)), ({ 'Urgente': 1 }, {}))
+
+    def test_prefix_mine_and_pagination(self):
+        Tag.objects.bulk_create([Tag(name=f'urgencia {i}') for i in range(3)])
+        response = self.client.get('/api/tags/', { 'prefix': 'URG' })
+        self.assertEqual(
+            [tag['name'] for tag in response.data['results']], ['Urgente', 'urgencia 0', 'urgencia 1', 'urgencia 2']
+        )
+        response = self.client.get('/api/tags/', { 'page_size': 2 })
+        self.assertEqual([tag['name'] for tag in response.data['results']], ['Casa', 'Trabajo'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([tag['name'] for tag in response.data['results']], ['Urgente', 'urgencia 0'])
+
+        for title in ['Una', 'Dos']:
+            Task.objects.create(title=title, user=self.user).tags.add(self.work)
+        self.task.tags.add(self.urgent, self.work)
+        Task.objects.create(title='Ajena', user=self.other).tags.add(self.home)
+        response = self.client.get('/api/tags/mine/')
+        self.assertEqual(
+            response.data['results'], [{ 'name': 'Trabajo', 'count': 3 }, { 'name': 'Urgente', 'count': 1 }]
+        )
+        response = self.client.get('/api/tags/mine/', { 'prefix': 'ur' })
+        self.assertEqual(response.data['results'], [{ 'name': 'Urgente', 'count': 1 }])
+        response = self.client.get('/api/tags/mine/', { 'page_size': 1 })
+        self.assertEqual((response.data['count'], response.data['next'].endswith('page=2&page_size=1')), (2, True))
+        self.assertEqual(self.client.get(response.data['next']).data['results'], [{ 'name': 'Urgente', 'count': 1 }])
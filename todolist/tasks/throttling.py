@@ -0,0 +1,87 @@
+"""
+Token bucket throttling of the signup and login endpoints.
+
+Both hash a password (and signup runs the password validators), so over-limit requests are turned away
+by the throttle check, before the view does any of that. Every request takes a token from the bucket of
+its client IP and from the bucket of the username it names; buckets refill continuously up to their
+burst size. They live in a bounded per-process store and, with AUTH_THROTTLE_SHARED, also in the shared
+cache so the limits hold across processes. The client IP comes from DRF's get_ident(), which trusts
+X-Forwarded-For according to the NUM_PROXIES setting.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+def take_token(bucket, now, burst, per_minute):
+    """Refill `bucket` (tokens, last update) up to `now` and take a token: new bucket and seconds to wait."""
+    tokens, updated = bucket
+    tokens = min(burst, tokens + (now - updated) * per_minute / 60)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) * 60 / per_minute
+
+
+class TokenBuckets:
+    """Per-process buckets, the least recently used dropped beyond AUTH_THROTTLE_MAX_KEYS."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, burst, per_minute):
+        now = time.monotonic()
+        with self.lock:
+            bucket, wait = take_token(self.buckets.pop(key, (burst, now)), now, burst, per_minute)
+            self.buckets[key] = bucket
+            while len(self.buckets) > settings.AUTH_THROTTLE_MAX_KEYS:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def take_shared(self, key, burst, per_minute):
+        # A plain read and write: concurrent requests may both get the last token, which is fine here.
+        now = time.time()
+        shared_key = f'throttle:{key}'
+        bucket, wait = take_token(cache.get(shared_key, (burst, now)), now, burst, per_minute)
+        cache.set(shared_key, bucket, math.ceil(burst * 60 / per_minute) + 1)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+auth_buckets = TokenBuckets()
+
+
+class AuthThrottle(BaseThrottle):
+    """Limit signup and login attempts per client IP and per username."""
+
+    def allow_request(self, request, view):
+        if not settings.AUTH_THROTTLE_ENABLED:
+            return True
+        limits = [(
+            f'ip:{self.get_ident(request)}', settings.AUTH_THROTTLE_IP_BURST, settings.AUTH_THROTTLE_IP_PER_MINUTE
+        )]
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if isinstance(username, str) and username:
+            limits.append((
+                f'username:{username.lower()}', settings.AUTH_THROTTLE_USERNAME_BURST,
+                settings.AUTH_THROTTLE_USERNAME_PER_MINUTE,
+            ))
+        for key, burst, per_minute in limits:
+            # The local bucket runs out first on a flood, sparing the cache round trip.
+            self.wait_time = auth_buckets.take(key, burst, per_minute)
+            if not self.wait_time and settings.AUTH_THROTTLE_SHARED:
+                self.wait_time = auth_buckets.take_shared(key, burst, per_minute)
+            if self.wait_time:
+                return False
+        return True
+
+    def wait(self):
+        return self.wait_time
@@ -0,0 +1,181 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import CharField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Concat, Length, Substr
+from django.utils import timezone
+from .counters import COUNTER_FIELDS, add_delta, apply_deltas, targets, weight
+from .models import Task
+from .usage import apply_usage, link_counts
+
+CYCLE_ERROR = 'La tarea padre no puede ser la propia tarea ni una de sus subtareas.'
+
+
+def descendants_sql(root_ids, depth=None):
+    """Recursive CTE returning the ids of the descendants of `root_ids`, down to `depth` levels if given."""
+    table = Task._meta.db_table
+    parent_column = Task._meta.get_field('parent_task').column
+    placeholders = ', '.join(['%s'] * len(root_ids))
+    params = list(root_ids)
+    if depth is None:
+        sql = (
+            f'WITH RECURSIVE subtree(id) AS ('
+            f'SELECT id FROM {table} WHERE {parent_column} IN ({placeholders}) '
+            f'UNION '
+            f'SELECT t.id FROM {table} t INNER JOIN subtree s ON t.{parent_column} = s.id'
+            f') SELECT id FROM subtree'
+        )
+    else:
+        sql = (
+            f'WITH RECURSIVE subtree(id, depth) AS ('
+            f'SELECT id, 1 FROM {table} WHERE {parent_column} IN ({placeholders}) '
+            f'UNION '
+            f'SELECT t.id, s.depth + 1 FROM {table} t INNER JOIN subtree s ON t.{parent_column} = s.id '
+            f'WHERE s.depth < %s'
+            f') SELECT id FROM subtree'
+        )
+        params.append(depth)
+    return sql, params
+
+
+def load_subtasks(tasks, depth=None, tags=True):
+    """
+    Load the descendants of `tasks` (down to `depth` levels, with their tags unless `tags` is False) in a
+    single query plus the tags prefetch and return a dict mapping each task id to its direct subtasks.
+    """
+    root_ids = [task.pk for task in tasks]
+    subtasks = {task_id: [] for task_id in root_ids}
+    if not root_ids or depth == 0:
+        return subtasks
+    descendants = Task.objects.filter(id__in=RawSQL(*descendants_sql(root_ids, depth))).order_by('id')
+    if tags:
+        descendants = descendants.prefetch_related('tags')
+    for task in descendants:
+        subtasks.setdefault(task.pk, [])
+        subtasks.setdefault(task.parent_task_id, []).append(task)
+    return subtasks
+
+
+def path_under(parent):
+    """Path of a child of `parent` (a Task or None)."""
+    return '' if parent is None else parent.subtree_path
+
+
+def creates_cycle(task, parent):
+    return parent is not None and (parent.pk == task.pk or parent.path.startswith(task.subtree_path))
+
+
+def subtree(tasks):
+    """Filter matching `tasks` and all their descendants, for one indexed query."""
+    condition = Q(pk__in=[task.pk for task in tasks])
+    for task in tasks:
+        condition |= Q(path__startswith=task.subtree_path)
+    return condition
+
+
+def delete_subtrees(queryset):
+    """Delete the tasks of `queryset` and their descendants, collected by path instead of level by level."""
+    tasks = list(queryset.only('id', 'path', 'parent_task_id', 'state', *COUNTER_FIELDS))
+    if not tasks:
+        return
+    deltas = {}
+    for task in tasks:
+        if not any(task.path.startswith(other.subtree_path) for other in tasks):
+            add_delta(deltas, targets(task.parent_task_id, task.path), *subtree_weight(task), sign=-1)
+    with transaction.atomic():
+        apply_deltas(deltas)
+        doomed = Task.objects.filter(subtree(tasks))
+        # Tells the post_delete handler that the counters are already settled.
+        doomed.counters_applied = True
+        apply_usage(link_counts(Task.tags.through.objects.filter(task__in=doomed)), sign=-1)
+        doomed.delete()
+
+
+def descendants_of(task):
+    return Task.objects.filter(path__startswith=task.subtree_path)
+
+
+def ancestors_of(task):
+    """Ancestors of `task`, root first, looked up by primary key."""
+    ids = [int(ancestor_id) for ancestor_id in task.path.split('/') if ancestor_id]
+    return Task.objects.filter(id__in=ids).order_by(Length('path'))
+
+
+def rewrite_paths(task_id, old_path, new_path):
+    """Move `task_id` and its descendants from under `old_path` to under `new_path` in one UPDATE."""
+    Task.objects.filter(Q(pk=task_id) | Q(path__startswith=f'{old_path}{task_id}/')).update(
+        path=Concat(Value(new_path), Substr('path', len(old_path) + 1), output_field=CharField())
+    )
+
+
+def subtree_weight(task):
+    return weight(task.state, task.subtask_count, task.completed_subtask_count)
+
+
+def counter_deltas(previous, parent_id, path, state):
+    """Counter deltas of a task going from its `previous` values to this parent, path and state."""
+    deltas = {}
+    counters = (previous['subtask_count'], previous['completed_subtask_count'])
+    old_weight = weight(previous['state'], *counters)
+    add_delta(deltas, targets(previous['parent_task_id'], previous['path']), *old_weight, sign=-1)
+    add_delta(deltas, targets(parent_id, path), *weight(state, *counters))
+    return deltas
+
+
+def current_values(task_id):
+    return Task.objects.values('path', 'parent_task_id', 'state', *COUNTER_FIELDS).get(pk=task_id)
+
+
+def prepare_save(task):
+    """
+    Set the path of `task` before it is saved and remember what the move or state change has to update
+    afterwards. Raises ValidationError when the new parent is the task itself or one of its descendants.
+    """
+    if task._state.adding:
+        if task.parent_task_id is not None and not task.path:
+            task.path = path_under(task.parent_task)
+        return
+    moved = task.parent_task_id != getattr(task, '_loaded_parent_id', task.parent_task_id)
+    if not moved and task.state == getattr(task, '_loaded_state', task.state):
+        return
+    # Fresh values, since the instance may have been loaded before other writes.
+    previous = current_values(task.pk)
+    if task.parent_task_id != previous['parent_task_id']:
+        parent = task.parent_task
+        if parent is not None and (parent.pk == task.pk or parent.path.startswith(f'{previous["path"]}{task.pk}/')):
+            raise ValidationError({ 'parent_task': CYCLE_ERROR })
+        task.path = path_under(parent)
+    else:
+        task.path = previous['path']
+    task._previous = previous
+
+
+def finish_save(task, created):
+    """Carry an insert, reparent or state change of `task` over to its descendants and counters."""
+    previous = task.__dict__.pop('_previous', None)
+    if created:
+        deltas = {}
+        add_delta(deltas, targets(task.parent_task_id, task.path), *subtree_weight(task))
+        apply_deltas(deltas)
+    elif previous is not None:
+        if task.path != previous['path']:
+            rewrite_paths(task.pk, previous['path'], task.path)
+        apply_deltas(counter_deltas(previous, task.parent_task_id, task.path, task.state))
+    task._loaded_parent_id = task.parent_task_id
+    task._loaded_state = task.state
+
+
+def move_subtree(task_id, parent_id):
+    """
+    Hang `task_id` and its descendants under `parent_id` (None for a root) with fresh paths read from the
+    database, so moves applied one after another never build a cycle. Returns False if this one would.
+    """
+    previous = current_values(task_id)
+    parent_path = '' if parent_id is None else Task.objects.values_list('path', flat=True).get(pk=parent_id)
+    new_path = '' if parent_id is None else f'{parent_path}{parent_id}/'
+    if parent_id == task_id or new_path.startswith(f'{previous["path"]}{task_id}/'):
+        return False
+    Task.objects.filter(pk=task_id).update(parent_task_id=parent_id, updated_at=timezone.now())
+    rewrite_paths(task_id, previous['path'], new_path)
+    apply_deltas(counter_deltas(previous, parent_id, new_path, previous['state']))
+    return True
@@ -0,0 +1,101 @@
+"""
+Precomputed tag usage per user.
+
+TagUsage stores how many tasks of a user carry each tag, for the usage-ranked tag listing. The
+m2m_changed handler keeps it current for add(), remove(), clear() and set(); the writers that touch the
+link table directly (bulk operations, import, restore and subtree deletes, which archival goes through)
+count the links they insert or drop with `link_counts` and call `apply_usage`. `rebuild_usage` recomputes
+it from scratch.
+"""
+
+from django.db import connection
+from django.db.models import Count, F
+from .models import TagUsage, Task
+
+
+def link_counts(links):
+    """{(user id, tag id): number of links} of a queryset over the task/tag link table, in one query."""
+    return {
+        (user_id, tag_id): count
+        for user_id, tag_id, count in links.order_by().values('task__user_id', 'tag_id').annotate(
+            count=Count('id')
+        ).values_list('task__user_id', 'tag_id', 'count')
+    }
+
+
+def apply_usage(counts, sign=1):
+    """
+    Add (or take away, with sign=-1) a {(user id, tag id): links} map. Additions are one upsert, so
+    concurrent writers add up on the same row; removals run one UPDATE per user and delta and drop the rows
+    that reach zero.
+    """
+    counts = { key: count for key, count in counts.items() if count }
+    if not counts:
+        return
+    if sign > 0:
+        # The same ON CONFLICT syntax on PostgreSQL and SQLite; bulk_create() can only overwrite the count.
+        table = TagUsage._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, tag_id, count) VALUES {", ".join(["(%s, %s, %s)"] * len(counts))} '
+                f'ON CONFLICT (user_id, tag_id) DO UPDATE SET count = {table}.count + excluded.count',
+                [value for (user_id, tag_id), count in counts.items() for value in (user_id, tag_id, count)],
+            )
+        return
+    groups = {}
+    for (user_id, tag_id), count in counts.items():
+        groups.setdefault((user_id, count), []).append(tag_id)
+    for (user_id, count), tag_ids in groups.items():
+        TagUsage.objects.filter(user_id=user_id, tag_id__in=tag_ids).update(count=F('count') - count)
+    TagUsage.objects.filter(user_id__in={ user_id for user_id, count in groups }, count=0).delete()
+
+
+def tag_links_changed(instance, action, reverse, pk_set):
+    """Carry an m2m_changed action on Task.tags over to the usage counts."""
+    TaskTag = Task.tags.through
+    if action == 'pre_clear':
+        # The links are gone by post_clear, so they are counted now.
+        instance._cleared_links = link_counts(TaskTag.objects.filter(**{ 'tag' if reverse else 'task': instance }))
+    elif action == 'post_clear':
+        apply_usage(getattr(instance, '_cleared_links', {}), sign=-1)
+    elif action == 'pre_remove':
+        # pk_set holds every id passed to remove(), linked or not, so only the existing links are counted.
+        links = TaskTag.objects.filter(**{ 'tag' if reverse else 'task': instance })
+        instance._removed_links = link_counts(links.filter(**{ 'task_id__in' if reverse else 'tag_id__in': pk_set }))
+    elif action == 'post_remove':
+        apply_usage(getattr(instance, '_removed_links', {}), sign=-1)
+    elif action == 'post_add' and pk_set:
+        # Unlike remove(), add() only reports the links it actually inserted.
+        if not reverse:
+            apply_usage({ (instance.user_id, tag_id): 1 for tag_id in pk_set })
+        else:
+            apply_usage({
+                (user_id, instance.pk): count
+                for user_id, count in Task.objects.filter(id__in=pk_set).order_by().values('user_id').annotate(
+                    count=Count('id')
+                ).values_list('user_id', 'count')
+            })
+
+
+def rebuild_usage(fix=True):
+    """
+    Recompute every usage count from the links and, with `fix`, store the ones that drifted. Returns the
+    number of checked counts and the (user id, tag id, stored, expected) tuples of the drifted ones.
+    """
+    expected = link_counts(Task.tags.through.objects.all())
+    stored = { (row.user_id, row.tag_id): row for row in TagUsage.objects.all() }
+    drifted = [
+        (user_id, tag_id, stored[key].count if key in stored else 0, expected.get(key, 0))
+        for key in sorted(expected.keys() | stored.keys())
+        for user_id, tag_id in [key]
+        if (stored[key].count if key in stored else 0) != expected.get(key, 0)
+    ]
+    if fix and drifted:
+        TagUsage.objects.filter(id__in=[
+            stored[(user_id, tag_id)].id for user_id, tag_id, count, total in drifted if not total
+        ]).delete()
+        TagUsage.objects.bulk_create([
+            TagUsage(user_id=user_id, tag_id=tag_id, count=total)
+            for user_id, tag_id, count, total in drifted if total
+        ], update_conflicts=True, unique_fields=['user', 'tag'], update_fields=['count'])
+    return len(expected.keys() | stored.keys()), drifted
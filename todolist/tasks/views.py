@@ -1,23 +1,104 @@
-from django.shortcuts import render
-from rest_framework import generics, viewsets
-from rest_framework.pagination import PageNumberPagination
+from contextlib import ExitStack
+from functools import partial
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.shortcuts import get_object_or_404, render
+from rest_framework import generics, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from django.contrib.auth.models import User
-from .models import Task, Tag
-from .serializers import UserSerializer, TaskSerializer, TagSerializer
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from .models import Task, TaskArchive, TaskImport, Tag, TagUsage
+from .serializers import (
+    UserSerializer, TaskSerializer, TagSerializer, TagUsageSerializer, TaskArchiveSerializer, TaskImportSerializer,
+    BulkTransitionSerializer, includes_field, parse_fieldset,
+)
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
+from todolist.routers import pin_to_primary, read_from_replica
 from .permissions import IsOwner
+from .throttling import AuthThrottle
+from .archive import restore_tree
+from .filters import filter_archived, filter_tasks, task_ordering
+from .bulk import apply_bulk_operations, transition_tasks
+from .cache import cached_response
+from .export import EXPORT_FORMATS
+from .facets import task_facets
+from .importer import read_rows, run_import
+from .sync import is_stale, task_changes
+from .fastpath import TASK_VALUES, serialize_task_rows
+from .conditional import conditional_response, tag_etag, task_etag
+from .tree import ancestors_of, delete_subtrees, descendants_of
 
 
 class UserRegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    permission_classes = [AllowAny] 
+    permission_classes = [AllowAny]
+    throttle_classes = [AuthThrottle]
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class ReplicaReadMixin:
+    """Read from a replica on safe requests and pin the user to the primary after a successful write."""
+
+    def dispatch(self, request, *args, **kwargs):
+        self.replica_reads = ExitStack()
+        with self.replica_reads:
+            response = super().dispatch(request, *args, **kwargs)
+        if self.request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(self.request.user.pk)
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        # After authentication, which reads the user from the primary.
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self.replica_reads.enter_context(read_from_replica(request.user.pk))
+
+
+class TagPagination(CursorPagination):
+    # Keyset pagination: the tag table is shared by every user, so no COUNT(*) over it.
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'name'
+
+
+class TagUsagePagination(PageNumberPagination):
+    # A cursor on the counts would skip or repeat tags as they change, and a user's list is short anyway.
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class TagViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TagPagination
+
+    def get_queryset(self):
+        prefix = self.request.query_params.get('prefix')
+        if self.action == 'mine':
+            queryset = TagUsage.objects.filter(user=self.request.user, count__gt=0).select_related('tag').order_by(
+                '-count', 'tag_id'
+            )
+            return queryset.filter(tag__name__istartswith=prefix) if prefix else queryset
+        return self.queryset.filter(name__istartswith=prefix) if prefix else self.queryset.all()
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(request, tag_etag(request), partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, tag_etag(request, kwargs['pk']), partial(super().retrieve, request, *args, **kwargs)
+        )
+
+    @action(detail=False, methods=['get'], pagination_class=TagUsagePagination, serializer_class=TagUsageSerializer)
+    def mine(self, request):
+        # The tags on the user's tasks, most used first, from the counts kept by tasks.usage.
+        return super().list(request)
 
 
 class TaskPagination(PageNumberPagination):
@@ -26,28 +107,198 @@ class TaskPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskCursorPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+
+
+PAGINATION_CLASSES = {
+    'page': TaskPagination,
+    'cursor': TaskCursorPagination,
+}
+
+
+class TaskViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated, IsOwner]
     pagination_class = TaskPagination
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            mode = self.request.query_params.get('pagination', settings.TASKS_PAGINATION_MODE)
+            self._paginator = PAGINATION_CLASSES.get(mode, self.pagination_class)()
+        return self._paginator
+
+    def list(self, request, *args, **kwargs):
+        # Keyset pages follow the id, which would drop the ranking of ?q= (see task_ordering).
+        if request.query_params.get('q') and isinstance(self.paginator, CursorPagination):
+            return Response(
+                { 'q': 'La búsqueda no admite paginación por cursor, usa pagination=page.' },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        build_response = self.fast_list if settings.TASKS_FAST_LIST else super().list
+        if request.query_params.get('archived') == 'true':
+            build_response = self.archived_list
+        return conditional_response(
+            request, task_etag(request),
+            partial(cached_response, request, 'list', partial(build_response, request, *args, **kwargs))
+        )
+
+    def fast_list(self, request, *args, **kwargs):
+        rows = filter_tasks(request.user, request.query_params).order_by(
+            *task_ordering(request.query_params)
+        ).values(*TASK_VALUES)
+        page = self.paginate_queryset(rows)
+        data = serialize_task_rows(page if page is not None else rows, self.get_serializer_context())
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def archived_list(self, request, *args, **kwargs):
+        queryset = filter_archived(request.user, request.query_params).order_by('id').prefetch_related('tags')
+        page = self.paginate_queryset(queryset)
+        data = TaskArchiveSerializer(page if page is not None else queryset, many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, task_etag(request, kwargs['pk']),
+            partial(cached_response, request, 'retrieve', partial(super().retrieve, request, *args, **kwargs))
+        )
+
+    def get_fieldset(self):
+        # Sparse fieldsets only apply to reads, so writes still validate every field.
+        if self.request.method != 'GET':
+            return {}
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = parse_fieldset(self.request.query_params)
+        return self._fieldset
+
+    def get_serializer_context(self):
+        return { **super().get_serializer_context(), **self.get_fieldset() }
+
     def get_queryset(self):
-        user = self.request.user
-        params = {
-            'user': user
-        }
-        state = self.request.query_params.get('state', None)
-        if state:
-            params['state'] = state
-        expiration_date = self.request.query_params.get('expiration_date', None)
-        if expiration_date:
-            params['expiration_date'] = expiration_date
-        queryset = Task.objects.filter(**params)
-        tags = self.request.query_params.getlist('tags')
-        if tags:
-            queryset = queryset.filter(tags__name__in=tags).distinct()
+        queryset = filter_tasks(self.request.user, self.request.query_params).order_by(
+            *task_ordering(self.request.query_params)
+        )
+        # The tree actions only read the path of the looked up task.
+        if includes_field(self.get_fieldset(), 'tags') and self.action not in ('descendants', 'ancestors'):
+            queryset = queryset.prefetch_related('tags')
         return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        delete_subtrees(Task.objects.filter(pk=instance.pk))
+
+    @action(detail=True, methods=['get'])
+    def descendants(self, request, pk=None):
+        rows = descendants_of(self.get_object()).filter(user=request.user).order_by('id').values(*TASK_VALUES)
+        # A flat list: parent_task places every entry in the tree.
+        context = { **self.get_serializer_context(), 'depth': 0 }
+        page = self.paginate_queryset(rows)
+        data = serialize_task_rows(page if page is not None else rows, context)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        rows = ancestors_of(self.get_object()).filter(user=request.user).values(*TASK_VALUES)
+        return Response(serialize_task_rows(rows, { **self.get_serializer_context(), 'depth': 0 }))
+
+    @action(detail=True, methods=['post'])
+    def restore(self, request, pk=None):
+        # Archived trees are restored whole, from their root.
+        if not str(pk).isdigit():
+            raise Http404
+        archived = get_object_or_404(TaskArchive, pk=pk, user=request.user, parent_task=None)
+        return Response(self.get_serializer(restore_tree(archived)).data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            return Response(
+                { 'detail': 'Se esperaba una lista de operaciones.' }, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({ 'results': apply_bulk_operations(request.user, request.data) })
+
+    @action(detail=False, methods=['post'])
+    def bulk_transition(self, request):
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = transition_tasks(
+            request.user, filter_tasks(request.user, request.query_params), **serializer.validated_data
+        )
+        return Response({ 'updated': updated })
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        # The expiration buckets move at midnight, so the date is part of the cache key.
+        today = timezone.localdate()
+        return cached_response(request, f'facets:{today.isoformat()}', lambda: Response(
+            task_facets(filter_tasks(request.user, request.query_params), today)
+        ))
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        since = request.query_params.get('since', '0')
+        limit = request.query_params.get('limit', str(settings.TASKS_SYNC_PAGE_SIZE))
+        if not since.isdigit():
+            return Response(
+                { 'since': 'El cursor debe ser un número entero positivo.' }, status=status.HTTP_400_BAD_REQUEST
+            )
+        if not limit.isdigit() or int(limit) == 0:
+            return Response(
+                { 'limit': 'El límite debe ser un número entero positivo.' }, status=status.HTTP_400_BAD_REQUEST
+            )
+        if is_stale(request.user, int(since)):
+            return Response(
+                { 'since': 'El cursor es demasiado antiguo, sincroniza de nuevo desde el principio.' },
+                status=status.HTTP_410_GONE
+            )
+        # Flat, like the tree actions: parent_task places every task.
+        return Response(task_changes(
+            request.user, int(since), min(int(limit), settings.TASKS_SYNC_PAGE_SIZE),
+            { **self.get_serializer_context(), 'depth': 0 }
+        ))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response(
+                { 'output': 'Formato no válido, usa ndjson o csv.' }, status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, lines = EXPORT_FORMATS[output]
+        queryset = filter_tasks(request.user, request.query_params).order_by('id')
+        response = StreamingHttpResponse(lines(queryset), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="tasks.{output}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_tasks(self, request):
+        serializer = TaskImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+        if 'resume' in options:
+            task_import = TaskImport.objects.filter(id=options['resume'], user=request.user, completed=False).first()
+            if task_import is None:
+                return Response({ 'resume': 'Importación no encontrada.' }, status=status.HTTP_404_NOT_FOUND)
+        else:
+            task_import = TaskImport.objects.create(user=request.user)
+        file = options['file']
+        input_format = options.get('input') or ('csv' if file.name.endswith('.csv') else 'ndjson')
+        report = run_import(
+            task_import, read_rows(file, input_format), settings.TASKS_IMPORT_BATCH_SIZE, options.get('max_rows')
+        )
+        if 'error' in report:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
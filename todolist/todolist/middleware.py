@@ -0,0 +1,179 @@
+"""
+Per-request SQL and timing instrumentation.
+
+A sampled share of requests (``REQUEST_INSTRUMENTATION_SAMPLE_RATE``) is measured: number of queries,
+exact duplicates, statements repeated often enough to look like an N+1, and database time against
+Python time. The figures are sent as ``Server-Timing`` headers and folded into rolling per-route
+aggregates that ``todolist.views.instrumentation_stats`` exposes to staff users, together with the
+response cache hits and misses reported by the ``X-Cache`` header.
+"""
+
+import heapq
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.executions = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+            self.executions[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        return sum(times - 1 for times in self.executions.values())
+
+    def repeated_statements(self, threshold):
+        return { sql: times for sql, times in self.statements.items() if times >= threshold }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class RouteStats:
+    def __init__(self, window, top_repeated):
+        self.requests = 0
+        self.samples = deque(maxlen=window)
+        self.repeated = {}
+        self.top_repeated = top_repeated
+        self.cache = Counter()
+
+    def add(self, total, db, queries, duplicates, repeated, cache=None):
+        self.requests += 1
+        if cache:
+            self.cache[cache] += 1
+        self.samples.append((total, db, queries, duplicates))
+        for sql, times in repeated.items():
+            self.repeated[sql] = max(times, self.repeated.get(sql, 0))
+        if len(self.repeated) > self.top_repeated:
+            # Statements with literal values differ on every request, so only the worst ones are kept.
+            self.repeated = dict(heapq.nlargest(self.top_repeated, self.repeated.items(), key=lambda item: item[1]))
+
+    def as_dict(self):
+        totals, dbs, queries, duplicates = zip(*self.samples)
+        return {
+            'requests': self.requests,
+            'total_p50_ms': round(percentile(totals, 50), 3),
+            'total_p95_ms': round(percentile(totals, 95), 3),
+            'db_p50_ms': round(percentile(dbs, 50), 3),
+            'db_p95_ms': round(percentile(dbs, 95), 3),
+            'queries_avg': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+            'duplicates_max': max(duplicates),
+            'repeated_statements': self.repeated,
+            'cache_hits': self.cache['HIT'],
+            'cache_misses': self.cache['MISS'],
+        }
+
+
+class RouteAggregates:
+    """Rolling figures of the last ``window`` sampled requests of every route, shared by all threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def add(self, route, *sample):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = RouteStats(
+                    settings.REQUEST_INSTRUMENTATION_WINDOW, settings.REQUEST_INSTRUMENTATION_TOP_REPEATED
+                )
+            stats.add(*sample)
+
+    def snapshot(self):
+        with self.lock:
+            return { route: stats.as_dict() for route, stats in sorted(self.routes.items()) }
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+aggregates = RouteAggregates()
+
+
+def route_name(request):
+    # View names keep the number of routes bounded, unlike raw paths.
+    match = request.resolver_match
+    return f'{request.method} {match.view_name if match else "<unresolved>"}'
+
+
+def record_queries(recorder):
+    """Wrap every connection of the current thread with `recorder`; closing the returned stack unwraps them."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
+
+
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.REQUEST_INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        self.report(request, response, recorder, start)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.REQUEST_INSTRUMENTATION_SAMPLE_RATE:
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        # The async ORM runs its queries in the request's thread sensitive executor, so the wrappers go
+        # on that thread's connections rather than on the event loop's.
+        stack = await sync_to_async(record_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.report(request, response, recorder, start)
+        return response
+
+    def report(self, request, response, recorder, start):
+        total = (time.perf_counter() - start) * 1000
+        db = recorder.duration * 1000
+        repeated = recorder.repeated_statements(settings.REQUEST_INSTRUMENTATION_REPEAT_THRESHOLD)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db:.3f};desc="{recorder.count} queries / {recorder.duplicates} duplicated"',
+            f'app;dur={total - db:.3f}',
+            f'total;dur={total:.3f}',
+        ])
+        if repeated:
+            response['X-Repeated-Queries'] = str(len(repeated))
+        aggregates.add(
+            route_name(request), total, db, recorder.count, recorder.duplicates, repeated, response.get('X-Cache')
+        )
@@ -0,0 +1,57 @@
+"""
+Read replica routing.
+
+Only code running under `read_from_replica()` reads from a replica (one per block, picked at random from
+``DATABASE_REPLICAS``); every other read and every write goes to the primary. A user who just wrote is
+pinned to the primary for ``REPLICA_PIN_SECONDS`` so they read their own writes despite replication lag.
+Pins live in the default cache, which has to be shared by all processes for them to hold everywhere.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+
+replica = ContextVar('replica', default=None)
+
+
+def pin_key(user_id):
+    return f'replica:pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+async def apin_to_primary(user_id):
+    await cache.aset(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id), False)
+
+
+@contextmanager
+def read_from_replica(user_id=None):
+    """Send the reads of the block to a replica, unless there is none or `user_id` is pinned."""
+    if not settings.DATABASE_REPLICAS or (user_id is not None and is_pinned(user_id)):
+        yield None
+        return
+    token = replica.set(random.choice(settings.DATABASE_REPLICAS))
+    try:
+        yield replica.get()
+    finally:
+        replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'todolist.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +53,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation (todolist.middleware)
+# Share of requests measured, rolling window per route, repeats of one statement flagged as N+1 and how many
+# of the most repeated statements each route keeps.
+REQUEST_INSTRUMENTATION_SAMPLE_RATE = float(getenv('REQUEST_INSTRUMENTATION_SAMPLE_RATE', 0.01))
+REQUEST_INSTRUMENTATION_WINDOW = 1000
+REQUEST_INSTRUMENTATION_REPEAT_THRESHOLD = 5
+REQUEST_INSTRUMENTATION_TOP_REPEATED = 20
+
 ROOT_URLCONF = 'todolist.urls'
 
 TEMPLATES = [
@@ -87,13 +96,77 @@ DATABASES = {
     }
 }
 
+# Read replicas: comma separated hosts sharing the primary's credentials. Safe requests to the task and
+# tag endpoints read from them (todolist.routers).
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, getenv('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica{index + 1}'] = {
+        **DATABASES['default'], 'HOST': host.strip(), 'TEST': { 'MIRROR': 'default' }
+    }
+    DATABASE_REPLICAS.append(f'replica{index + 1}')
+DATABASE_ROUTERS = ['todolist.routers.ReplicaRouter']
+# Seconds a user keeps reading from the primary after a write; above the expected replication lag.
+REPLICA_PIN_SECONDS = int(getenv('REPLICA_PIN_SECONDS', 5))
+
 
 # JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'tasks.authentication.CachedJWTAuthentication',
+    ),
+    # JSON through orjson, and MessagePack for clients sending Accept: application/msgpack.
+    'DEFAULT_RENDERER_CLASSES': (
+        'tasks.renderers.ORJSONRenderer',
+        'tasks.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'tasks.renderers.ORJSONParser',
+        'tasks.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
+# Users resolved from JWTs are kept in a per-process LRU (and, if enabled, in the shared cache) for
+# this many seconds. Saving or deleting a user invalidates its entry.
+JWT_USER_CACHE_TTL = int(getenv('JWT_USER_CACHE_TTL', 60))
+JWT_USER_CACHE_SIZE = 10000
+JWT_USER_CACHE_SHARED = getenv('JWT_USER_CACHE_SHARED', 'False') == 'True'
+# Token buckets in front of signup and login (tasks.throttling): burst size and refill rate per client IP
+# and per username. With AUTH_THROTTLE_SHARED the buckets are also kept in the shared cache.
+AUTH_THROTTLE_ENABLED = getenv('AUTH_THROTTLE_ENABLED', 'True') == 'True'
+AUTH_THROTTLE_IP_BURST = 20
+AUTH_THROTTLE_IP_PER_MINUTE = 30
+AUTH_THROTTLE_USERNAME_BURST = 5
+AUTH_THROTTLE_USERNAME_PER_MINUTE = 5
+AUTH_THROTTLE_SHARED = getenv('AUTH_THROTTLE_SHARED', 'False') == 'True'
+AUTH_THROTTLE_MAX_KEYS = 100000
+
+
+# Tasks
+# 'page' (PageNumberPagination) or 'cursor' (keyset pagination, no total count).
+# Clients can override it per request with ?pagination=page|cursor.
+TASKS_PAGINATION_MODE = getenv('TASKS_PAGINATION_MODE', 'page')
+# Seconds a cached task list/detail response is kept. Entries are invalidated on write anyway.
+TASKS_CACHE_TIMEOUT = int(getenv('TASKS_CACHE_TIMEOUT', 300))
+# Build task list responses straight from .values() rows instead of TaskSerializer.
+TASKS_FAST_LIST = getenv('TASKS_FAST_LIST', 'True') == 'True'
+# Rows fetched per round trip (and per tags prefetch) by the streaming export.
+TASKS_EXPORT_CHUNK_SIZE = 2000
+# Rows inserted per transaction (and checkpoint) by the task import.
+TASKS_IMPORT_BATCH_SIZE = 1000
+# Subtask counters cover every descendant instead of the direct subtasks. Run rebuild_subtask_counts
+# after changing it.
+TASKS_SUBTASK_ROLLUP = getenv('TASKS_SUBTASK_ROLLUP', 'False') == 'True'
+# archive_tasks moves trees completed and untouched for this many days, this many trees per transaction.
+TASKS_ARCHIVE_AFTER_DAYS = int(getenv('TASKS_ARCHIVE_AFTER_DAYS', 90))
+TASKS_ARCHIVE_BATCH_SIZE = 500
+# Changes returned per /api/tasks/changes/ response (clients can ask for fewer with ?limit=).
+TASKS_SYNC_PAGE_SIZE = 500
+# prune_tombstones drops the tombstones of tasks deleted this many days ago, this many per transaction.
+# Sync clients that have been offline for longer have to sync from scratch.
+TASKS_TOMBSTONE_DAYS = int(getenv('TASKS_TOMBSTONE_DAYS', 30))
+TASKS_TOMBSTONE_BATCH_SIZE = 1000
 
 
 # Password validation
@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from tasks.models import Task
+from .middleware import RouteStats, aggregates
+
+
+@override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=1.0, REQUEST_INSTRUMENTATION_REPEAT_THRESHOLD=3)
+class QueryInstrumentationTestCase(TestCase):
+    def setUp(self):
+        aggregates.reset()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_header(self):
+        Task.objects.create(title='Tarea', user=self.user)
+        response = self.client.get('/api/tasks/', format='json')
+        self.assertEqual(response.status_code, 200)
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['db', 'app', 'total'])
+        self.assertIn('queries', response['Server-Timing'])
+
+    def test_repeated_statements_are_flagged(self):
+        for i in range(4):
+            self.client.post('/api/tags/', { 'name': f'tag-{i}' }, format='json')
+        # Creating a task with tags runs one get_or_create per tag.
+        data = { 'title': 'Con etiquetas', 'tags': [{ 'name': f'nueva-{i}' } for i in range(4)] }
+        response = self.client.post('/api/tasks/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('X-Repeated-Queries', response)
+
+    def test_aggregates_are_staff_only(self):
+        self.client.get('/api/tasks/', format='json')
+        self.client.get('/api/tasks/', format='json')
+        response = self.client.get('/api/instrumentation/', format='json')
+        self.assertEqual(response.status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/instrumentation/', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['GET task-list']['requests'], 2)
+        self.assertIn('db_p95_ms', response.data['GET task-list'])
+        self.assertEqual(response.data['GET task-list']['cache_misses'], 1)
+        self.assertEqual(response.data['GET task-list']['cache_hits'], 1)
+
+    def test_repeated_statements_are_capped(self):
+        stats = RouteStats(window=10, top_repeated=2)
+        for i in range(5):
+            stats.add(1.0, 0.5, 10, 0, { f'SELECT {i}': 5 + i })
+        self.assertEqual(stats.as_dict()['repeated_statements'], { 'SELECT 4': 9, 'SELECT 3': 8 })
+
+    @override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get('/api/tasks/', format='json')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(aggregates.snapshot(), {})
@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from .views import instrumentation_stats
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/instrumentation/', instrumentation_stats, name='instrumentation_stats'),
     path('api/', include('tasks.urls')),
 ]
@@ -0,0 +1,12 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .middleware import aggregates
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def instrumentation_stats(request):
+    if request.method == 'DELETE':
+        aggregates.reset()
+    return Response(aggregates.snapshot())